@@ -1,9 +1,14 @@
 import sys
 import os
 import importlib.util
+import ast
 import json
 import subprocess
 import shutil
+import atexit
+import hashlib
+import concurrent.futures
+import functools
 
 # --- Configuration ---
 # Get the absolute path of the directory where this script is located
@@ -11,8 +16,33 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SUBCOMMANDS_DIR = os.path.join(BASE_DIR, "subcommands")
 SUBCOMMAND_ENVS_DIR = os.path.join(BASE_DIR, "subcommands_envs")
 SUBCOMMAND_TOOLS_DIR = os.path.join(BASE_DIR, "subcommands_tools")
+_CACHE_PATH = os.path.join(BASE_DIR, ".subcommands_cache.json")
+# Upper bound on environments prepared at once during 'update'; more mostly thrashes disk I/O.
+MAX_PARALLEL_INSTALLS = 4
+
+# Top-level names read from each subcommand, mapped to their key in the metadata dict and default value.
+METADATA_FIELDS = {
+    "REQUIRES": ("requires", []),
+    "INPUT_SCHEMA": ("input_schema", []),
+    "PERSISTENT_WORKER": ("persistent", False),
+}
+
+# CPython only launches children via posix_spawn (instead of fork + exec) when close_fds is False and no
+# preexec_fn, cwd or new session is requested. Descriptors are non-inheritable by default (PEP 446), so
+# keeping them open leaks nothing. Windows has no posix_spawn, so it keeps the default of closing them.
+SPAWN_CLOSE_FDS = sys.platform == "win32"
+
+# Where distributions install jemalloc; used when SUBCOMMAND_ALLOCATOR=jemalloc is set.
+JEMALLOC_PATHS = (
+    "/usr/lib/x86_64-linux-gnu/libjemalloc.so.2",
+    "/usr/lib/aarch64-linux-gnu/libjemalloc.so.2",
+    "/usr/lib64/libjemalloc.so.2",
+    "/usr/lib/libjemalloc.so.2",
+    "/usr/local/lib/libjemalloc.so.2",
+)
 
 # --- Cross-Platform Helpers ---
+@functools.lru_cache(maxsize=None)
 def get_python_executable(env_path):
     """Returns the correct Python executable path for the given environment based on the OS."""
     if sys.platform == "win32":
@@ -21,6 +51,7 @@ def get_python_executable(env_path):
         # Assumes a POSIX-compliant system (Linux, macOS)
         return os.path.join(env_path, "bin", "python")
 
+@functools.lru_cache(maxsize=None)
 def get_pip_executable(env_path):
     """Returns the correct pip executable path for the given environment based on the OS."""
     if sys.platform == "win32":
@@ -28,11 +59,80 @@ def get_pip_executable(env_path):
     else:
         return os.path.join(env_path, "bin", "pip")
 
+def _fast_rmtree(path):
+    """
+    Deletes a directory tree using the platform's native tool, which is much faster than
+    shutil.rmtree on virtual environments with tens of thousands of files.
+    Falls back to shutil.rmtree if the native tool is unavailable or leaves the folder behind.
+    """
+    if sys.platform == "win32":
+        command = ["cmd", "/c", "rd", "/s", "/q", path]
+    else:
+        command = ["rm", "-rf", "--", path]
+    try:
+        subprocess.run(command, check=False, capture_output=True)
+    except OSError:
+        pass
+    if os.path.exists(path):
+        shutil.rmtree(path, ignore_errors=True)
+
 # --- Subcommand Discovery and Management ---
+def _load_metadata_cache():
+    """Loads the on-disk metadata cache, returning an empty dict if it is missing or unreadable."""
+    try:
+        with open(_CACHE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_metadata_cache(cache):
+    """Atomically writes the metadata cache so a concurrent reader never sees a partial file."""
+    tmp_path = f"{_CACHE_PATH}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, _CACHE_PATH)
+    except OSError as e:
+        print(f"Warning: Could not write subcommand cache: {e}", file=sys.stderr)
+
+def read_subcommand_metadata(name, path):
+    """
+    Extracts the metadata constants from a subcommand without running it.
+    The module is parsed with 'ast' and literal assignments are evaluated directly; only when a
+    value is not a plain literal do we fall back to executing the module.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+
+    metadata = {key: default for key, default in METADATA_FIELDS.values()}
+    for node in tree.body:
+        # Both 'REQUIRES = [...]' and annotated 'REQUIRES: list = [...]' forms are recognised.
+        if isinstance(node, ast.Assign):
+            targets = node.targets
+        elif isinstance(node, ast.AnnAssign) and node.value is not None:
+            targets = [node.target]
+        else:
+            continue
+        for target in targets:
+            if isinstance(target, ast.Name) and target.id in METADATA_FIELDS:
+                try:
+                    metadata[METADATA_FIELDS[target.id][0]] = ast.literal_eval(node.value)
+                except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+                    return _exec_subcommand_metadata(name, path)
+    return metadata
+
+def _exec_subcommand_metadata(name, path):
+    """Fallback for non-literal metadata: imports the module and reads the attributes."""
+    spec = importlib.util.spec_from_file_location(name, path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return {key: getattr(mod, attr, default) for attr, (key, default) in METADATA_FIELDS.items()}
+
 def discover_subcommands():
     """
     Discovers all valid Python subcommands in the SUBCOMMANDS_DIR.
     A valid subcommand is a .py file that does not start with an underscore.
+    Metadata is cached on disk and only re-read for files whose mtime or size changed.
     """
     subcommands = {}
     if not os.path.exists(SUBCOMMANDS_DIR):
@@ -40,40 +140,80 @@ def discover_subcommands():
         os.makedirs(SUBCOMMANDS_DIR)
         return subcommands
 
-    for fname in os.listdir(SUBCOMMANDS_DIR):
-        if fname.endswith(".py") and not fname.startswith("_"):
-            name = fname[:-3]
-            path = os.path.join(SUBCOMMANDS_DIR, fname)
-            try:
-                spec = importlib.util.spec_from_file_location(name, path)
-                mod = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(mod)
-                
-                # UPDATED: This now looks for a single INPUT_SCHEMA list, enforcing our new, simpler standard.
-                subcommands[name] = {
-                    "requires": getattr(mod, "REQUIRES", []),
-                    "input_schema": getattr(mod, "INPUT_SCHEMA", []) # Default to empty list if not found
-                }
+    cache = _load_metadata_cache()
+    new_cache = {}
+
+    with os.scandir(SUBCOMMANDS_DIR) as entries:
+        for entry in entries:
+            if not (entry.name.endswith(".py") and not entry.name.startswith("_") and entry.is_file()):
+                continue
+            name = entry.name[:-3]
+            stat = entry.stat()
+            signature = [stat.st_mtime_ns, stat.st_size]
 
+            cached = cache.get(name)
+            if cached and cached.get("signature") == signature:
+                subcommands[name] = cached["metadata"]
+                new_cache[name] = cached
+                continue
+
+            try:
+                subcommands[name] = read_subcommand_metadata(name, entry.path)
+                new_cache[name] = {"signature": signature, "metadata": subcommands[name]}
             except Exception as e:
                 print(f"Error loading subcommand '{name}': {e}", file=sys.stderr)
                 subcommands[name] = {"error": f"Error loading: {e}"}
+
+    if new_cache != cache:
+        _save_metadata_cache(new_cache)
     
     return subcommands
 
+_SUBCOMMANDS_CACHE = None
+
+def _get_subcommands(force=False):
+    """Returns discovered subcommands, discovering at most once per process unless forced."""
+    global _SUBCOMMANDS_CACHE
+    if force or _SUBCOMMANDS_CACHE is None:
+        _SUBCOMMANDS_CACHE = discover_subcommands()
+    return _SUBCOMMANDS_CACHE
+
+def _requirements_signature(packages):
+    """Returns a stable hash of a REQUIRES list, used to detect when an environment is already up to date."""
+    return hashlib.sha256("\n".join(sorted(packages)).encode("utf-8")).hexdigest()
+
+def is_environment_current(env_path, packages):
+    """
+    Returns True if the environment was last installed with exactly this package list.
+    This is a single file read, so it is cheap enough to run before every subcommand call.
+    """
+    try:
+        with open(os.path.join(env_path, ".installed.sig"), "r", encoding="utf-8") as f:
+            return f.read() == _requirements_signature(packages)
+    except OSError:
+        return False
+
 def install_dependencies(env_path, packages):
     """
     Installs a list of packages into a specific virtual environment.
+    Skips pip entirely when the environment was last installed with the same package list.
     """
     if not packages:
         return True
     
+    if is_environment_current(env_path, packages):
+        return True
+
+    signature = _requirements_signature(packages)
+    signature_path = os.path.join(env_path, ".installed.sig")
     print(f"Installing/verifying packages in '{env_path}'...", file=sys.stderr)
     pip_exe = get_pip_executable(env_path)
     
     try:
-        command = [pip_exe, "install", "--upgrade"] + list(packages)
+        command = [pip_exe, "install", "--upgrade", "--no-input", "--disable-pip-version-check", "-q"] + list(packages)
         subprocess.run(command, check=True, capture_output=True, text=True, encoding='utf-8')
+        with open(signature_path, "w", encoding="utf-8") as f:
+            f.write(signature)
         print(f"  + Dependencies are up to date for '{os.path.basename(env_path)}'.", file=sys.stderr)
         return True
     except subprocess.CalledProcessError as e:
@@ -108,32 +248,124 @@ def cleanup_orphaned_files(subcommand_names):
     
     # Clean up orphaned environments
     if os.path.exists(SUBCOMMAND_ENVS_DIR):
-        for folder_name in os.listdir(SUBCOMMAND_ENVS_DIR):
-            if folder_name not in subcommand_names:
-                folder_path = os.path.join(SUBCOMMAND_ENVS_DIR, folder_name)
-                print(f"  - Cleaning up orphaned environment for '{folder_name}'...", file=sys.stderr)
-                shutil.rmtree(folder_path, ignore_errors=True)
-                cleaned_count += 1
+        with os.scandir(SUBCOMMAND_ENVS_DIR) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False) and entry.name not in subcommand_names:
+                    print(f"  - Cleaning up orphaned environment for '{entry.name}'...", file=sys.stderr)
+                    _fast_rmtree(entry.path)
+                    cleaned_count += 1
 
     # Clean up orphaned tool folders
     if os.path.exists(SUBCOMMAND_TOOLS_DIR):
-        for folder_name in os.listdir(SUBCOMMAND_TOOLS_DIR):
-            if folder_name not in subcommand_names:
-                folder_path = os.path.join(SUBCOMMAND_TOOLS_DIR, folder_name)
-                print(f"  - Cleaning up orphaned tools folder for '{folder_name}'...", file=sys.stderr)
-                shutil.rmtree(folder_path, ignore_errors=True)
-                cleaned_count += 1
+        with os.scandir(SUBCOMMAND_TOOLS_DIR) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False) and entry.name not in subcommand_names:
+                    print(f"  - Cleaning up orphaned tools folder for '{entry.name}'...", file=sys.stderr)
+                    _fast_rmtree(entry.path)
+                    cleaned_count += 1
 
     if cleaned_count == 0:
         print("  + No orphaned files found. Everything is tidy!", file=sys.stderr)
 
-def run_subcommand(name, input_data):
+# --- Subprocess Environment ---
+@functools.lru_cache(maxsize=None)
+def find_jemalloc():
+    """Returns the first jemalloc shared library found on this system, or None."""
+    return next((path for path in JEMALLOC_PATHS if os.path.exists(path)), None)
+
+def apply_allocator(env):
+    """
+    Preloads jemalloc into subcommand processes when SUBCOMMAND_ALLOCATOR=jemalloc (Linux only).
+    Audio tools churn through multi-megabyte buffers, which glibc malloc tends to fragment.
+    """
+    if os.environ.get("SUBCOMMAND_ALLOCATOR") != "jemalloc" or not sys.platform.startswith("linux"):
+        return
+    library = find_jemalloc()
+    if not library:
+        print("Warning: SUBCOMMAND_ALLOCATOR=jemalloc is set, but no libjemalloc was found.", file=sys.stderr)
+        return
+    env["LD_PRELOAD"] = " ".join(filter(None, [library, env.get("LD_PRELOAD")]))
+    env.setdefault("MALLOC_CONF", "background_thread:true,metadata_thp:auto")
+
+# --- Persistent Workers ---
+class WorkerPool:
+    """
+    Keeps one '--serve' process per subcommand for the lifetime of this manager run, so heavy imports
+    are paid once per run. That only pays off in --ndjson mode, where one run serves many requests.
+    Requests and responses are exchanged as newline-delimited JSON over stdin/stdout.
+    """
+    def __init__(self):
+        self._workers = {}
+
+    def _spawn(self, name, python_exe, script_path, env):
+        print(f"Starting persistent worker for '{name}'...", file=sys.stderr)
+        proc = subprocess.Popen(
+            [python_exe, script_path, "--serve"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=None, # Inherit stderr so worker logs stream through without a pipe to drain
+            bufsize=1,
+            text=True,
+            encoding='utf-8',
+            env=env,
+            close_fds=SPAWN_CLOSE_FDS
+        )
+        self._workers[name] = proc
+        return proc
+
+    def request(self, name, python_exe, script_path, env, input_data):
+        """Sends one request to the worker for 'name' and returns its raw JSON response line."""
+        proc = self._workers.get(name)
+        if proc is None or proc.poll() is not None:
+            proc = self._spawn(name, python_exe, script_path, env)
+
+        try:
+            proc.stdin.write(json.dumps(input_data) + "\n")
+            proc.stdin.flush()
+            response = proc.stdout.readline()
+        except (BrokenPipeError, OSError):
+            response = ""
+
+        if not response:
+            # The worker died mid-request; forget it so the next call starts a fresh one.
+            self._workers.pop(name, None)
+            raise RuntimeError(f"Persistent worker for '{name}' exited unexpectedly.")
+        return response.strip()
+
+    def discard(self, name):
+        """Kills the worker for 'name', e.g. after it wrote something that was not a protocol response."""
+        proc = self._workers.pop(name, None)
+        if proc is not None and proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+    def shutdown(self):
+        """Closes every worker's stdin and waits briefly before terminating stragglers."""
+        for name, proc in list(self._workers.items()):
+            try:
+                proc.stdin.close()
+                proc.wait(timeout=5)
+            except Exception:
+                proc.terminate()
+        self._workers.clear()
+
+WORKER_POOL = WorkerPool()
+atexit.register(WORKER_POOL.shutdown)
+
+def run_subcommand(name, input_data, ndjson=False):
     """
     Prepares the environment for and executes a specific subcommand.
+    In NDJSON mode every call prints exactly one compact JSON line to stdout, errors included,
+    so a caller can pair each response with its request.
     """
-    subcommands = discover_subcommands()
+    def fail(message):
+        print(f"ERROR: {message}", file=sys.stderr)
+        if ndjson:
+            print(json.dumps({"status": "error", "message": message}), flush=True)
+
+    subcommands = _get_subcommands()
     if name not in subcommands or "error" in subcommands[name]:
-        print(f"ERROR: Subcommand '{name}' not found or could not be loaded.", file=sys.stderr)
+        fail(f"Subcommand '{name}' not found or could not be loaded.")
         return
 
     subcommand_metadata = subcommands[name]
@@ -141,22 +373,53 @@ def run_subcommand(name, input_data):
     
     if requires:
         env_path = os.path.join(SUBCOMMAND_ENVS_DIR, name)
-        if not create_environment(env_path) or not install_dependencies(env_path, requires):
-            return 
+        # Fast path: an up-to-date signature implies the environment exists, so skip both setup steps.
+        if not is_environment_current(env_path, requires):
+            if not create_environment(env_path) or not install_dependencies(env_path, requires):
+                fail(f"Could not prepare the environment for '{name}'.")
+                return
         python_exe = get_python_executable(env_path)
     else:
         python_exe = sys.executable
 
     subcommand_tool_path = os.path.join(SUBCOMMAND_TOOLS_DIR, name)
-    if not os.path.exists(subcommand_tool_path):
-        os.makedirs(subcommand_tool_path)
+    os.makedirs(subcommand_tool_path, exist_ok=True)
 
     execution_env = os.environ.copy()
     execution_env["SUBCOMMAND_TOOL_PATH"] = subcommand_tool_path
+    apply_allocator(execution_env)
     
     subcommand_script_path = os.path.join(SUBCOMMANDS_DIR, f"{name}.py")
     
     print(f"\n--- Running Subcommand: {name} ---", file=sys.stderr)
+
+    if subcommand_metadata.get("persistent"):
+        try:
+            response = WORKER_POOL.request(name, python_exe, subcommand_script_path, execution_env, input_data)
+        except FileNotFoundError:
+            fail(f"Python executable not found at '{python_exe}'.")
+            return
+        except RuntimeError as e:
+            fail(str(e))
+            return
+
+        try:
+            status = json.loads(response).get("status")
+        except (ValueError, AttributeError):
+            # Stray output or a non-object line means the worker's stdout is out of step with its requests.
+            WORKER_POOL.discard(name)
+            fail(f"Worker protocol error from '{name}': expected a JSON object, got {response[:200]!r}")
+            return
+
+        if ndjson:
+            print(response, flush=True)
+        elif status == "error":
+            # Errors come back on stdout in serve mode; route them to stderr like a one-shot run would.
+            print(response, file=sys.stderr)
+        else:
+            print(response)
+        return
+
     try:
         process = subprocess.Popen(
             [python_exe, subcommand_script_path],
@@ -165,49 +428,100 @@ def run_subcommand(name, input_data):
             stderr=subprocess.PIPE,
             text=True,
             encoding='utf-8',
-            env=execution_env
+            env=execution_env,
+            close_fds=SPAWN_CLOSE_FDS
         )
         stdout, stderr = process.communicate(input=json.dumps(input_data))
         
-        # For n8n, clean JSON output must go to stdout
-        print(stdout)
-        
         # Stderr can be used for logging/debugging information in n8n
         if stderr:
             print(stderr, file=sys.stderr)
+
+        if ndjson:
+            print(_as_ndjson_line(stdout, stderr), flush=True)
+        else:
+            # For n8n, clean JSON output must go to stdout
+            print(stdout)
             
     except FileNotFoundError:
-        print(f"ERROR: Python executable not found at '{python_exe}'.", file=sys.stderr)
+        fail(f"Python executable not found at '{python_exe}'.")
+
+def _as_ndjson_line(stdout, stderr):
+    """
+    Re-serializes a one-shot run's (possibly indented) stdout as one compact line. A run that printed
+    no valid JSON failed; its last stderr line, usually the script's own error object, is reported instead.
+    """
+    try:
+        return json.dumps(json.loads(stdout))
+    except ValueError:
+        pass
+    error_lines = [line for line in stderr.splitlines() if line.strip()]
+    if error_lines:
+        try:
+            error = json.loads(error_lines[-1])
+            if isinstance(error, dict):
+                return json.dumps(error)
+        except ValueError:
+            pass
+    message = error_lines[-1] if error_lines else "Subcommand produced no JSON output."
+    return json.dumps({"status": "error", "message": message})
 
 # --- Main CLI Logic ---
 def main():
     """The main command-line interface router."""
     if len(sys.argv) < 2:
         print("Usage: python manager.py <command> [args...]", file=sys.stderr)
-        print("Available commands: list, update, <subcommand_name>", file=sys.stderr)
+        print("Available commands: list, update, <subcommand_name> [--ndjson]", file=sys.stderr)
         return
 
     command = sys.argv[1]
 
+    # Create the managed folders once per process so later steps never need an exists() check first.
+    os.makedirs(SUBCOMMAND_ENVS_DIR, exist_ok=True)
+    os.makedirs(SUBCOMMAND_TOOLS_DIR, exist_ok=True)
+
     if command == "list":
-        subcommands = discover_subcommands()
+        subcommands = _get_subcommands()
         # IMPORTANT: Output raw JSON for machine parsing by the n8n node.
         print(json.dumps(subcommands))
 
     elif command == "update":
         print("\n--- Running Full System Update and Cleanup ---", file=sys.stderr)
-        subcommands = discover_subcommands()
+        subcommands = _get_subcommands()
         cleanup_orphaned_files(subcommands.keys())
-        for name, data in subcommands.items():
-            if data.get("requires"):
-                env_path = os.path.join(SUBCOMMAND_ENVS_DIR, name)
-                if create_environment(env_path):
-                    install_dependencies(env_path, data["requires"])
+        tasks = [
+            (os.path.join(SUBCOMMAND_ENVS_DIR, name), data["requires"])
+            for name, data in subcommands.items() if data.get("requires")
+        ]
+        if tasks:
+            # Environments are independent, so their (network and disk bound) installs can overlap.
+            def prepare(task):
+                env_path, requires = task
+                return create_environment(env_path) and install_dependencies(env_path, requires)
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_INSTALLS, len(tasks))) as executor:
+                list(executor.map(prepare, tasks))
         print("\nUpdate and cleanup complete.", file=sys.stderr)
 
     else:
         # This branch handles running a specific subcommand
         subcommand_name = command
+
+        if "--ndjson" in sys.argv[2:]:
+            # Opt-in batch mode: one JSON request per stdin line, answered by one JSON line each, in order.
+            # Persistent workers stay up for the whole run, so their start-up cost is paid once per batch.
+            for line in sys.stdin:
+                if not line.strip():
+                    continue
+                try:
+                    input_data = json.loads(line)
+                except json.JSONDecodeError:
+                    print("ERROR: Could not decode a JSON request line from standard input.", file=sys.stderr)
+                    print(json.dumps({"status": "error", "message": "Invalid JSON request line."}), flush=True)
+                    continue
+                run_subcommand(subcommand_name, input_data, ndjson=True)
+            return
+
         input_data = {}
 
         try:
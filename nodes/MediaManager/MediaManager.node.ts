@@ -86,6 +86,46 @@ async function executeManagerCommand(
     });
 }
 
+// Runs one manager process for many requests using its NDJSON mode: one JSON request per stdin line,
+// one JSON response per stdout line, in order. Persistent workers then start once per execution.
+async function executeManagerCommandLines(
+    this: IExecuteFunctions,
+    command: string,
+    inputs: object[],
+): Promise<any[]> {
+    const projectPath = path.join(__dirname, '..', '..', '..');
+    const managerPath = path.join(projectPath, 'manager.py');
+    const pythonExecutable = process.platform === 'win32' ? 'python.exe' : 'python';
+    const venvSubfolder = process.platform === 'win32' ? 'Scripts' : 'bin';
+    const pythonPath = path.join(projectPath, 'venv', venvSubfolder, pythonExecutable);
+
+    return new Promise((resolve, reject) => {
+        const process = spawn(pythonPath, [managerPath, command, '--ndjson']);
+        let stdout = '';
+        let stderr = '';
+        process.stdout.on('data', (data) => stdout += data.toString());
+        process.stderr.on('data', (data) => stderr += data.toString());
+        process.on('close', (code) => {
+            if (stderr) console.error(`Manager stderr: ${stderr}`);
+            if (code !== 0) {
+                return reject(new NodeOperationError(this.getNode(), `Execution of '${command}' failed with non-zero exit code. Error: ${stderr || 'Unknown error'}`));
+            }
+            const lines = stdout.split('\n').filter(line => line.trim() !== '');
+            if (lines.length !== inputs.length) {
+                return reject(new NodeOperationError(this.getNode(), `Expected ${inputs.length} responses from '${command}', got ${lines.length}. Output: ${stdout}`));
+            }
+            try {
+                resolve(lines.map(line => JSON.parse(line)));
+            } catch (e) {
+                reject(new NodeOperationError(this.getNode(), `Python script did not return valid JSON for '${command}'. Output: ${stdout}`));
+            }
+        });
+        process.on('error', (err) => reject(new NodeOperationError(this.getNode(), `Failed to spawn Python process. Error: ${err.message}`)));
+        process.stdin.write(inputs.map(input => JSON.stringify(input) + '\n').join(''));
+        process.stdin.end();
+    });
+}
+
 // --- Main Node Class ---
 
 export class MediaManager implements INodeType {
@@ -246,13 +286,33 @@ export class MediaManager implements INodeType {
         // --- SINGLE ITEM PROCESSING LOGIC (CORRECTED) ---
         else {
             const returnData: INodeExecutionData[] = [];
+            if (items.length === 0) {
+                return [returnData];
+            }
+
+            // All items go through a single manager run, one request line per item.
+            const inputs = items.map((item, index) => {
+                const itemParameters = this.getNodeParameter('parameters', index) as { value: object };
+                return { '@item': itemParameters.value };
+            });
+
+            let results: any[];
+            try {
+                results = await executeManagerCommandLines.call(this, subcommand, inputs);
+            } catch (error) {
+                if (this.continueOnFail()) {
+                    const errorData = items.map((item, index) => ({ json: item.json, error: error as NodeOperationError, pairedItem: { item: index } }));
+                    return [this.helpers.returnJsonArray(errorData)];
+                }
+                throw error;
+            }
+
             for (let i = 0; i < items.length; i++) {
                 try {
-                    // This is the correct fix!
-                    const itemParameters = this.getNodeParameter('parameters', i) as { value: object };
-                    const inputData = { '@item': itemParameters.value };
-
-                    const result = await executeManagerCommand.call(this, subcommand, inputData);
+                    const result = results[i];
+                    if (result && result.status === 'error') {
+                        throw new NodeOperationError(this.getNode(), `Subcommand '${subcommand}' failed: ${result.message}`, { itemIndex: i });
+                    }
 
                     // Merge the result with the original item's data.
                     const newItem: INodeExecutionData = {
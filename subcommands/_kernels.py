@@ -0,0 +1,39 @@
+"""
+Numba kernels shared by the audio subcommands.
+
+Files starting with an underscore are not subcommands, so the manager never lists or runs this module.
+Importing it raises ImportError when Numba is not installed; callers fall back to NumPy in that case.
+Each kernel computes its gain ramp inline in a single parallel pass over frames of a (frames, channels)
+array, so no ramp buffers or intermediate products are allocated. Gains match np.linspace(0, 1, n).
+"""
+from numba import njit, prange
+
+
+# cache=True stores the compiled kernels next to this file, so only the first run pays the JIT cost.
+@njit(parallel=True, fastmath=True, cache=True)
+def fade_in_inplace(buf, n):
+    """Scales the first 'n' frames of 'buf' by a linear ramp from 0 to 1."""
+    for i in prange(n):
+        gain = i / (n - 1) if n > 1 else 0.0
+        for c in range(buf.shape[1]):
+            buf[i, c] *= gain
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def fade_out_inplace(buf, n):
+    """Scales the last 'n' frames of 'buf' by a linear ramp from 1 to 0."""
+    start = buf.shape[0] - n
+    for i in prange(n):
+        gain = (n - 1 - i) / (n - 1) if n > 1 else 0.0
+        for c in range(buf.shape[1]):
+            buf[start + i, c] *= gain
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def crossfade_inplace(tail, head):
+    """Overwrites 'tail' with its linear crossfade into 'head'; both hold the same number of frames."""
+    n = tail.shape[0]
+    for i in prange(n):
+        gain = i / (n - 1) if n > 1 else 0.0
+        for c in range(tail.shape[1]):
+            tail[i, c] = tail[i, c] * (1.0 - gain) + head[i, c] * gain
@@ -1,6 +1,7 @@
 import sys
 import os
 import json
+import hashlib
 
 # --- Required Metadata ---
 
@@ -8,6 +9,7 @@ import json
 REQUIRES = [
     "librosa==0.10.1",
     "numpy==1.26.4",
+    "orjson",
     "setuptools", 
 ]
 
@@ -38,18 +40,30 @@ INPUT_SCHEMA = [
     }
 ]
 
+# 3. PERSISTENT WORKER
+# The manager keeps this script running in '--serve' mode so librosa is only imported once.
+PERSISTENT_WORKER = True
+
 # --- Helper Functions ---
 
+ANALYSIS_SAMPLE_RATE = 11025
+# At 11025 Hz these match a 1024 hop / 2048 FFT at 22050 Hz: ~21 onset frames per second, which is
+# still several frames per beat window while needing half the FFT work of librosa's default 2048.
+ONSET_HOP_LENGTH = 512
+ONSET_N_FFT = 1024
+
 def analyze_beats(audio_file, beats_per_second, smoothing_factor=0.1):
     """
-    Analyze an audio file and return beat strengths at a specified frequency.
+    Analyze an audio file and return beat times and strengths at a specified frequency.
     """
     # CORRECT: Import required modules inside the function that uses them.
     import librosa
     import numpy as np
+    from scipy.signal import lfilter
 
     try:
-        y, sr = librosa.load(audio_file)
+        # Onset and RMS analysis is adequate at a quarter of CD rate; decoding there halves memory and FFT work.
+        y, sr = librosa.load(audio_file, sr=ANALYSIS_SAMPLE_RATE, mono=True, res_type="polyphase", dtype=np.float32)
         
         rms = librosa.feature.rms(y=y)[0]
         mean_rms = np.mean(rms)
@@ -59,99 +73,189 @@ def analyze_beats(audio_file, beats_per_second, smoothing_factor=0.1):
         elif mean_rms < 0.2: loudness_category = 3
         else: loudness_category = 4
         
-        duration = librosa.get_duration(y=y, sr=sr)
-        onset_env = librosa.onset.onset_strength(y=y, sr=sr)
-        frames_per_second = len(onset_env) / duration
+        duration = y.shape[0] / float(sr)
+        onset_env = librosa.onset.onset_strength(
+            y=y, sr=sr, hop_length=ONSET_HOP_LENGTH, n_fft=ONSET_N_FFT
+        ).astype(np.float32, copy=False)
+        frames_per_second = sr / float(ONSET_HOP_LENGTH)
         
         num_beats = int(duration * beats_per_second)
+        if num_beats <= 0:
+            # Clips shorter than one beat interval (or a zero rate) have nothing to analyze.
+            return [], [], loudness_category
         timestamps = np.arange(num_beats) / beats_per_second
         
         window_size = 0.1
-        beat_strengths = []
+        start_frames = (np.maximum(timestamps - window_size, 0) * frames_per_second).astype(np.int64)
+        end_frames = (np.minimum(timestamps + window_size, duration) * frames_per_second).astype(np.int64)
         
-        for timestamp in timestamps:
-            start_time = max(0, timestamp - window_size)
-            end_time = min(duration, timestamp + window_size)
-            start_frame = int(start_time * frames_per_second)
-            end_frame = int(end_time * frames_per_second)
-            
-            if start_frame >= len(onset_env): break
-            end_frame = min(end_frame, len(onset_env))
-            
-            if start_frame < end_frame:
-                window_max = np.max(onset_env[start_frame:end_frame])
-            else:
-                window_max = onset_env[start_frame] if start_frame < len(onset_env) else 0
-            
-            beat_strengths.append(window_max)
+        # Windows are ordered, so dropping those that start past the envelope is the same as stopping there.
+        # The first window always starts at frame 0, so at least one beat remains.
+        in_range = start_frames < len(onset_env)
+        start_frames = start_frames[in_range]
+        end_frames = np.minimum(end_frames[in_range], len(onset_env))
+        
+        # One reduceat over interleaved (start, end) bounds yields every window's max in a single call.
+        # Even slots hold max(onset_env[start:end]); an empty window yields onset_env[start], as before.
+        # The padding element keeps an end bound equal to len(onset_env) a valid index.
+        bounds = np.empty(2 * len(start_frames), dtype=np.int64)
+        bounds[0::2] = start_frames
+        bounds[1::2] = end_frames
+        beat_strengths = np.maximum.reduceat(np.append(onset_env, 0), bounds)[0::2]
         
-        smoothed_strengths = np.array(beat_strengths)
+        # reduceat already returned a fresh float32 array, so this does not copy.
+        smoothed_strengths = np.asarray(beat_strengths, dtype=np.float32)
         if len(beat_strengths) > 1:
-            for i in range(1, len(beat_strengths)):
-                smoothed_strengths[i] = (1 - smoothing_factor) * beat_strengths[i] + smoothing_factor * smoothed_strengths[i-1]
+            # First-order IIR: s[i] = (1 - a) * x[i] + a * s[i-1], seeded so that s[0] = x[0].
+            # float32 coefficients keep lfilter from upcasting the whole signal to float64.
+            smoothed_strengths = lfilter(
+                np.array([1 - smoothing_factor], dtype=np.float32),
+                np.array([1.0, -smoothing_factor], dtype=np.float32),
+                smoothed_strengths,
+                zi=np.array([smoothing_factor * smoothed_strengths[0]], dtype=np.float32)
+            )[0]
         
-        if len(smoothed_strengths) > 0:
-            min_val, max_val = np.min(smoothed_strengths), np.max(smoothed_strengths)
-            if max_val > min_val:
-                normalized = ((smoothed_strengths - min_val) / (max_val - min_val)) * 100
-            else:
-                normalized = np.zeros_like(smoothed_strengths)
+        min_val, max_val = smoothed_strengths.min(), smoothed_strengths.max()
+        if max_val > min_val:
+            # Normalize in place to avoid allocating a temporary array per operation.
+            # Dividing before scaling keeps the maximum at exactly 100 after truncation.
+            normalized = smoothed_strengths
+            np.subtract(normalized, min_val, out=normalized)
+            np.divide(normalized, max_val - min_val, out=normalized)
+            np.multiply(normalized, 100, out=normalized)
         else:
-            normalized = []
+            normalized = np.zeros_like(smoothed_strengths)
             
-        return normalized.astype(int).tolist(), loudness_category
+        beat_times = np.round(timestamps[:len(normalized)], 2).tolist()
+        return beat_times, normalized.astype(np.int32).tolist(), loudness_category
         
     except Exception as e:
         # Re-raise the exception to be caught by the main function's error handler
         raise RuntimeError(f"Error analyzing audio file: {e}")
 
-# --- Main Execution Logic ---
+# Upper bound on the stored results kept in beat_cache; least recently used entries go first.
+MAX_BEAT_CACHE_BYTES = 64 * 1024 * 1024
 
-def main(input_data, tool_path):
+def get_result_cache_path(tool_path, audio_file, beats_per_second, smoothing_factor):
     """
-    The primary function executed by the manager.
+    Returns the cache file for this analysis, or None when no tool folder is available.
+    The key covers the audio file's identity and this script's own mtime, so edits to either invalidate it.
+    """
+    if not tool_path:
+        return None
+    audio_stat = os.stat(audio_file)
+    key = (
+        os.path.abspath(audio_file), audio_stat.st_mtime_ns, audio_stat.st_size,
+        beats_per_second, smoothing_factor, os.stat(__file__).st_mtime_ns
+    )
+    digest = hashlib.blake2b(repr(key).encode("utf-8"), digest_size=16).hexdigest()
+    return os.path.join(tool_path, "beat_cache", f"{digest}.json")
+
+def prune_beat_cache(cache_dir, keep=()):
     """
+    Deletes the least recently used results until 'cache_dir' fits in MAX_BEAT_CACHE_BYTES.
+    Entries orphaned by edited audio files or script changes are never hit again, so they age out first.
+    Cache hits refresh an entry's mtime, so mtime order is use order. Paths in 'keep' are never removed.
+    """
+    entries = []
     try:
-        # --- 1. Access Input Data ---
-        # This tool only processes single items, so we always look for the '@item' key.
-        item_data = input_data.get("@item", {})
-        if not item_data:
-             raise ValueError("Input data is missing the '@item' key. This tool processes items individually.")
+        with os.scandir(cache_dir) as it:
+            for entry in it:
+                # In-progress writes ('<digest>.json.<pid>.tmp') belong to a running request.
+                if entry.is_file() and entry.name.endswith(".json"):
+                    entry_stat = entry.stat()
+                    entries.append((entry_stat.st_mtime_ns, entry_stat.st_size, entry.path))
+    except OSError:
+        return
+    total_bytes = sum(size for _, size, _ in entries)
+    keep = set(keep)
+    for _, size, path in sorted(entries):
+        if total_bytes <= MAX_BEAT_CACHE_BYTES:
+            break
+        if path in keep:
+            continue
+        try:
+            os.remove(path)
+            total_bytes -= size
+        except OSError:
+            pass
 
-        audio_file = item_data.get("audio_file")
-        beats_per_second = item_data.get("beats_per_second", 2.0)
-        smoothing = item_data.get("smoothing_factor", 0.1)
+def write_json(result):
+    """Writes a result to stdout as a single line of compact JSON, serialized by orjson."""
+    import orjson
+    sys.stdout.flush()
+    sys.stdout.buffer.write(orjson.dumps(result, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n")
+    sys.stdout.buffer.flush()
 
-        if not audio_file or not os.path.exists(audio_file):
-            raise FileNotFoundError(f"Audio file not found at '{audio_file}'")
+# --- Main Execution Logic ---
 
-        # --- 2. Your Logic Here ---
-        beat_strengths, loudness_category = analyze_beats(audio_file, beats_per_second, smoothing)
-        
-        loudness_descriptions = {
-            1: "Very quiet (e.g., ambient, soft classical)",
-            2: "Moderate (e.g., acoustic, soft pop)",
-            3: "Loud (e.g., rock, electronic)",
-            4: "Very loud (e.g., metal, hard electronic)"
-        }
-        
-        beat_data = [
-            {"time": round(i / beats_per_second, 2), "strength": strength}
-            for i, strength in enumerate(beat_strengths)
-        ]
-        
-        # --- 3. Return Clean JSON Output ---
-        result = {
-            "status": "success",
-            "input": audio_file,
-            "beats_per_second": beats_per_second,
-            "loudness_category": loudness_category,
-            "loudness_description": loudness_descriptions.get(loudness_category, "Unknown"),
-            "total_beats": len(beat_strengths),
-            "beat_data": beat_data
-        }
+def process_item(input_data, tool_path):
+    """
+    Runs the analysis for a single request and returns the result dictionary.
+    """
+    # --- 1. Access Input Data ---
+    # This tool only processes single items, so we always look for the '@item' key.
+    item_data = input_data.get("@item", {})
+    if not item_data:
+         raise ValueError("Input data is missing the '@item' key. This tool processes items individually.")
+
+    audio_file = item_data.get("audio_file")
+    beats_per_second = item_data.get("beats_per_second", 2.0)
+    smoothing = item_data.get("smoothing_factor", 0.1)
+
+    if not audio_file or not os.path.exists(audio_file):
+        raise FileNotFoundError(f"Audio file not found at '{audio_file}'")
+
+    # Unchanged files return the stored result before librosa is ever imported.
+    cache_path = get_result_cache_path(tool_path, audio_file, beats_per_second, smoothing)
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            result = json.load(f)
+        # Marks the entry as recently used for prune_beat_cache().
+        os.utime(cache_path)
+        return result
+
+    # --- 2. Your Logic Here ---
+    beat_times, beat_strengths, loudness_category = analyze_beats(audio_file, beats_per_second, smoothing)
+    
+    loudness_descriptions = {
+        1: "Very quiet (e.g., ambient, soft classical)",
+        2: "Moderate (e.g., acoustic, soft pop)",
+        3: "Loud (e.g., rock, electronic)",
+        4: "Very loud (e.g., metal, hard electronic)"
+    }
+    
+    beat_data = [{"time": time, "strength": strength} for time, strength in zip(beat_times, beat_strengths)]
+    
+    # --- 3. Return Clean JSON Output ---
+    result = {
+        "status": "success",
+        "input": audio_file,
+        "beats_per_second": beats_per_second,
+        "loudness_category": loudness_category,
+        "loudness_description": loudness_descriptions.get(loudness_category, "Unknown"),
+        "total_beats": len(beat_strengths),
+        "beat_data": beat_data
+    }
+
+    if cache_path:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        os.replace(tmp_path, cache_path)
+        prune_beat_cache(os.path.dirname(cache_path), keep=(cache_path,))
+
+    return result
+
+def main(input_data, tool_path):
+    """
+    The primary function executed by the manager.
+    """
+    try:
+        result = process_item(input_data, tool_path)
         # The result is printed to stdout for n8n to capture.
-        print(json.dumps(result, indent=4))
+        write_json(result)
 
     except Exception as e:
         # Catch any exceptions and report them clearly as JSON to stderr.
@@ -159,8 +263,25 @@ def main(input_data, tool_path):
         print(json.dumps(error_message), file=sys.stderr)
         sys.exit(1)
 
+def serve(tool_path):
+    """
+    Persistent worker loop: answers one newline-delimited JSON request per line until stdin closes.
+    """
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            result = process_item(json.loads(line), tool_path)
+        except Exception as e:
+            result = {"status": "error", "message": str(e)}
+        write_json(result)
+
 # --- Boilerplate for Direct Execution ---
 if __name__ == "__main__":
+    if "--serve" in sys.argv[1:]:
+        serve(os.environ.get("SUBCOMMAND_TOOL_PATH", ""))
+        sys.exit(0)
+
     stdin_content = sys.stdin.read()
     
     if stdin_content:
@@ -3,6 +3,50 @@ import os
 import json
 import tempfile
 import subprocess
+import wave
+import collections
+import contextlib
+import concurrent.futures
+import functools
+import hashlib
+import threading
+
+# CPU threads available to this process. sched_getaffinity respects pinning, which cpu_count() ignores.
+CPU_THREADS = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+
+# OpenMP/MKL read these once when torch loads, so they must be set before the import. Explicit settings win.
+os.environ.setdefault("OMP_NUM_THREADS", str(CPU_THREADS))
+os.environ.setdefault("MKL_NUM_THREADS", str(CPU_THREADS))
+
+# Heavy dependencies are imported once, when the process starts, instead of inside each call.
+# The guard keeps this file importable without them, e.g. when inspected from the manager's environment;
+# the original error is kept so load_model() can report why the import failed (a broken CUDA wheel
+# surfaces as an OSError from a shared library rather than as a missing package).
+_IMPORT_ERROR = None
+try:
+    import torch
+    import torchaudio as ta
+    import ffmpeg
+    from chatterbox.tts import ChatterboxTTS
+except (ImportError, OSError) as e:
+    torch = ta = ffmpeg = ChatterboxTTS = None
+    _IMPORT_ERROR = e
+
+if torch is not None:
+    # Generation is one sequential chain of ops, so intra-op threads do the work and inter-op threads
+    # would only compete with them for cores.
+    try:
+        torch.set_num_threads(int(os.environ["OMP_NUM_THREADS"]))
+        torch.set_num_interop_threads(1)
+    except (ValueError, RuntimeError) as e:
+        print(f"Warning: Could not configure torch CPU threads: {e}", file=sys.stderr)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+json_loads = orjson.loads if orjson is not None else json.loads
 
 # --- Required Metadata ---
 
@@ -13,6 +57,7 @@ REQUIRES = [
     "torchaudio",
     "torch",
     "ffmpeg-python==0.2.0",
+    "orjson",
     "setuptools",
 ]
 
@@ -56,26 +101,288 @@ INPUT_SCHEMA = [
     }
 ]
 
+# 3. PERSISTENT WORKER
+# Loading the model dominates short requests, so the manager keeps this script alive in '--serve' mode.
+PERSISTENT_WORKER = True
 
-# --- Main Execution Logic ---
 
-def main(input_data, tool_path):
+# --- Helper Functions ---
+
+# Sample rate ChatterboxTTS expects for speaker reference audio.
+REFERENCE_SAMPLE_RATE = 24000
+
+# Upper bound on the converted references kept in speaker_cache; least recently used entries go first.
+MAX_SPEAKER_CACHE_BYTES = 256 * 1024 * 1024
+
+def is_reference_ready(path):
     """
-    Main function to handle TTS generation for single or batch items.
+    Returns True if 'path' is already a mono 16-bit PCM WAV at the reference sample rate and can be
+    given to the model as-is. Only the header is read; unreadable files return False and get converted.
     """
-    # Import heavy libraries here so the 'list' command in manager.py is fast
-    import torchaudio as ta
-    from chatterbox.tts import ChatterboxTTS
-    import ffmpeg
+    if not path.lower().endswith(".wav"):
+        return False
+    try:
+        info = ta.info(path)
+    except Exception:
+        return False
+    return (info.sample_rate == REFERENCE_SAMPLE_RATE and info.num_channels == 1
+            and info.bits_per_sample == 16 and info.encoding == "PCM_S")
 
-    # Redirect print() to stderr for logging, so stdout is clean for n8n JSON output
-    original_stdout = sys.stdout
-    sys.stdout = sys.stderr
+def get_reference_cache_path(tool_path, source_path):
+    """
+    Returns where the converted copy of a speaker reference is cached in the tool folder.
+    The key covers the file's path, mtime and size, so an edited reference is converted again.
+    """
+    source_stat = os.stat(source_path)
+    key = (os.path.abspath(source_path), source_stat.st_mtime_ns, source_stat.st_size, REFERENCE_SAMPLE_RATE)
+    digest = hashlib.blake2b(repr(key).encode("utf-8"), digest_size=16).hexdigest()
+    return os.path.join(tool_path, "speaker_cache", f"{digest}.wav")
 
-    temp_files_to_clean = []
-    final_output_path = None
+def prune_speaker_cache(cache_dir, keep=()):
+    """
+    Deletes the least recently used converted references until 'cache_dir' fits in MAX_SPEAKER_CACHE_BYTES.
+    Cache hits refresh an entry's mtime, so mtime order is use order. Paths in 'keep' are never removed.
+    """
+    entries = []
+    try:
+        with os.scandir(cache_dir) as it:
+            for entry in it:
+                # In-progress conversions ('<digest>.<pid>.tmp.wav') belong to a running request.
+                if entry.is_file() and entry.name.endswith(".wav") and not entry.name.endswith(".tmp.wav"):
+                    entry_stat = entry.stat()
+                    entries.append((entry_stat.st_mtime_ns, entry_stat.st_size, entry.path))
+    except OSError:
+        return
+    total_bytes = sum(size for _, size, _ in entries)
+    keep = set(keep)
+    for _, size, path in sorted(entries):
+        if total_bytes <= MAX_SPEAKER_CACHE_BYTES:
+            break
+        if path in keep:
+            continue
+        try:
+            os.remove(path)
+            total_bytes -= size
+        except OSError:
+            pass
 
+def prepare_reference_audio(source_path, output_path, device="cpu"):
+    """
+    Writes a 16-bit, 24 kHz WAV copy of a speaker reference for the model.
+    Decoding happens in-process with torchaudio and resampling runs on 'device'; only formats its
+    backend cannot read fall back to an ffmpeg subprocess. The result is still saved to disk because
+    prepare_conditionals() only accepts a file path.
+    """
+    try:
+        wav, sr = ta.load(source_path)
+    except Exception:
+        (
+            ffmpeg.input(source_path)
+            .output(output_path, acodec='pcm_s16le', ar=REFERENCE_SAMPLE_RATE)
+            .global_args("-hide_banner", "-loglevel", "error", "-nostdin")
+            .run(overwrite_output=True, quiet=True)
+        )
+        return
+    if sr != REFERENCE_SAMPLE_RATE:
+        wav = ta.functional.resample(wav.to(device), sr, REFERENCE_SAMPLE_RATE, lowpass_filter_width=6).cpu()
+    ta.save(output_path, wav, REFERENCE_SAMPLE_RATE, encoding="PCM_S", bits_per_sample=16)
+
+
+def write_json(result, stream=None):
+    """
+    Writes a result as a single line of compact JSON, serialized by orjson when available.
+    'stream' defaults to the current sys.stdout; the worker passes its saved protocol stream.
+    """
+    stream = stream or sys.stdout
+    if orjson is not None:
+        stream.buffer.write(orjson.dumps(result) + b"\n")
+    else:
+        stream.write(json.dumps(result) + "\n")
+    stream.flush()
+
+def remove_temp_file(file_path):
+    """Deletes a temp file, warning instead of failing if it cannot be removed."""
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"Warning: Could not remove temp file '{file_path}': {e}", file=sys.stderr)
+
+# Containers whose default audio codec is AAC.
+AAC_EXTENSIONS = frozenset({".m4a", ".mp4", ".aac", ".m4b"})
+
+@functools.lru_cache(maxsize=None)
+def ffmpeg_has_encoder(name):
+    """Returns True if the installed ffmpeg lists encoder 'name'. Probed once per process."""
+    try:
+        result = subprocess.run(["ffmpeg", "-hide_banner", "-nostdin", "-encoders"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    return any(line.split()[1:2] == [name] for line in result.stdout.splitlines())
+
+def open_pcm_encoder(output_path, sample_rate):
+    """
+    Starts an ffmpeg process that reads mono 16-bit PCM from stdin and writes 'output_path'.
+    AAC containers use libfdk_aac when ALLOW_LIBFDK=1 and the build includes it (it is not
+    redistributable, so it is opt-in); other extensions let ffmpeg pick the codec.
+    """
+    codec_args = []
+    if os.path.splitext(output_path)[1].lower() in AAC_EXTENSIONS:
+        if os.environ.get("ALLOW_LIBFDK") == "1" and ffmpeg_has_encoder("libfdk_aac"):
+            codec_args = ["-c:a", "libfdk_aac", "-b:a", "128k"]
+        else:
+            codec_args = ["-c:a", "aac", "-b:a", "128k"]
+    command = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "s16le", "-ar", str(sample_rate), "-ac", "1", "-i", "pipe:0",
+        *codec_args, "-threads", str(CPU_THREADS),
+        output_path
+    ]
+    return subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+def pcm16_bytes(wav):
+    """
+    Converts a float waveform in [-1, 1] to mono 16-bit little-endian PCM bytes for the encoder.
+    Clamping and scaling are done in place, so the only extra copy is the int16 result. Must run
+    under torch.inference_mode() when 'wav' was produced there.
+    """
+    return wav.detach().to("cpu").squeeze(0).clamp_(-1, 1).mul_(32767).to(torch.int16).numpy().tobytes()
+
+def finish_pcm_encoder(encoder):
+    """Closes the encoder's input, waits for it to flush the file and raises if ffmpeg failed."""
+    _, stderr = encoder.communicate()
+    if encoder.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to encode the output: {stderr.decode('utf-8', errors='replace').strip()}")
+
+
+# --- Model Cache ---
+
+# Loaded models keyed by device, so a persistent worker pays the load cost only once.
+_MODEL_CACHE = {}
+_MODEL_LOCK = threading.Lock()
+
+# Speaker conditionals computed by get_speaker_conds(), most recently used last.
+MAX_CACHED_SPEAKERS = 32
+_CONDS_CACHE = collections.OrderedDict()
+
+def compile_model(model, device):
+    """
+    Compiles the T3 transformer backbone with torch.compile (torch 2.0+) when CHATTERBOX_COMPILE=1.
+    It is opt-in because compilation plus its warm-up takes minutes, while a worker only lives for one
+    manager run; enable it when a single run (e.g. an --ndjson batch) generates enough speech to repay it.
+    A warm-up generation under the same autocast as real requests triggers it at load time, and any
+    failure falls back to eager mode.
+    """
+    if os.environ.get("CHATTERBOX_COMPILE") != "1" or int(torch.__version__.split(".")[0]) < 2:
+        return
+    # T3 runs its backbone once per generated token; compiling its forward is what removes dispatch overhead.
+    backbone = model.t3.tfmr
+    eager_forward = backbone.forward
     try:
+        backbone.forward = torch.compile(eager_forward, mode="reduce-overhead", dynamic=True)
+        with torch.inference_mode(), get_inference_context(device)():
+            model.generate("Warming up the compiled model.")
+        print("Compiled the ChatterboxTTS transformer backbone.", file=sys.stderr)
+    except Exception as e:
+        backbone.forward = eager_forward
+        print(f"Warning: torch.compile failed, continuing in eager mode: {e}", file=sys.stderr)
+
+def quantize_model(model, device):
+    """
+    Applies dynamic int8 quantization to the T3 Linear layers when running on the CPU with
+    CHATTERBOX_QUANTIZE=int8. CPU matmuls are memory-bound, so int8 weights cut the bytes moved per token.
+    Falls back to the float model if the module structure rejects quantization.
+    """
+    if device != "cpu" or os.environ.get("CHATTERBOX_QUANTIZE") != "int8":
+        return
+    # FBGEMM provides the VNNI/AVX2 int8 GEMMs on x86; QNNPACK is the ARM equivalent.
+    engines = torch.backends.quantized.supported_engines
+    engine = next((name for name in ("fbgemm", "qnnpack") if name in engines), None)
+    if engine is None:
+        print("Warning: No int8 quantization engine is available, continuing in float32.", file=sys.stderr)
+        return
+    try:
+        torch.backends.quantized.engine = engine
+        model.t3 = torch.ao.quantization.quantize_dynamic(model.t3, {torch.nn.Linear}, dtype=torch.qint8)
+        print(f"Quantized the ChatterboxTTS transformer to int8 ({engine}).", file=sys.stderr)
+    except Exception as e:
+        print(f"Warning: int8 quantization failed, continuing in float32: {e}", file=sys.stderr)
+
+def get_inference_context(device):
+    """
+    Returns a factory for the autocast context used around generation: bf16 on CUDA GPUs that support it
+    (same range as fp32, so no overflow in attention logits), fp16 on older GPUs, and bf16 on the CPU when
+    CHATTERBOX_QUANTIZE=bf16. Otherwise generation runs in the model's own precision.
+    """
+    if device == "cuda":
+        dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+        return lambda: torch.autocast(device_type="cuda", dtype=dtype)
+    if os.environ.get("CHATTERBOX_QUANTIZE") == "bf16":
+        return lambda: torch.autocast(device_type="cpu", dtype=torch.bfloat16)
+    return contextlib.nullcontext
+
+def get_speaker_conds(model, device, source_path, reference_wav_path, exaggeration):
+    """
+    Returns the model conditionals for a speaker, computing them from its prepared reference on first use.
+    Entries are keyed by the original reference file's identity, so a persistent worker reuses them across
+    requests while an edited file is encoded again. The least recently used speaker is evicted first.
+    """
+    source_stat = os.stat(source_path)
+    key = (device, os.path.abspath(source_path), source_stat.st_mtime_ns, source_stat.st_size)
+    conds = _CONDS_CACHE.get(key)
+    if conds is not None:
+        _CONDS_CACHE.move_to_end(key)
+        return conds
+    with torch.inference_mode():
+        model.prepare_conditionals(reference_wav_path, exaggeration=exaggeration)
+    _CONDS_CACHE[key] = model.conds
+    if len(_CONDS_CACHE) > MAX_CACHED_SPEAKERS:
+        _CONDS_CACHE.popitem(last=False)
+    return model.conds
+
+def get_device():
+    """Runs on the GPU when one is present; the CPU path stays as the fallback for CPU-only hosts."""
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+def load_model(device):
+    """
+    Returns the ChatterboxTTS model for 'device', loading it on first use.
+    Logs go to stderr explicitly because the persistent worker may load from a background thread.
+    """
+    with _MODEL_LOCK:
+        if device not in _MODEL_CACHE:
+            print(f"Loading ChatterboxTTS on device '{device}'.", file=sys.stderr)
+            model = ChatterboxTTS.from_pretrained(device=device)
+            quantize_model(model, device)
+            compile_model(model, device)
+            _MODEL_CACHE[device] = model
+        return _MODEL_CACHE[device]
+
+def warm_up_model():
+    """Loads the model ahead of the first request; errors are left for that request to report."""
+    try:
+        load_model(get_device())
+    except Exception as e:
+        print(f"Warning: Could not preload ChatterboxTTS: {e}", file=sys.stderr)
+
+
+# --- Main Execution Logic ---
+
+def generate_speech(input_data, tool_path):
+    """
+    Handles TTS generation for single or batch items and returns the result dictionary.
+    Progress is logged with print(); callers redirect stdout to stderr while this runs.
+    """
+    if ChatterboxTTS is None:
+        raise ImportError(
+            f"ChatterboxTTS dependencies could not be imported ({_IMPORT_ERROR}). Run 'python manager.py update'."
+        ) from _IMPORT_ERROR
+
+    final_output_path = None
+
+    # Every temp file registers its own removal on this stack, so cleanup also runs on errors.
+    with contextlib.ExitStack() as stack:
         # --- 1. Determine Mode and Prepare Script ---
         if "@items" in input_data:
             tts_script = input_data.get("@items", [])
@@ -99,9 +406,10 @@ def main(input_data, tool_path):
         else:
             final_output_path = base_output_path
         
+        # A bare filename has no directory part, and makedirs('') would raise.
         output_dir = os.path.dirname(final_output_path)
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
 
         # --- 3. Pre-process Speaker Audios ---
         speakers_dict = {}
@@ -111,76 +419,155 @@ def main(input_data, tool_path):
             if speaker_path and speaker_path not in speakers_dict:
                 speakers_dict[speaker_path] = f"speaker_{len(speakers_dict)}"
 
+        conversions = []
         for path, speaker_id in speakers_dict.items():
             if not os.path.exists(path):
                 raise FileNotFoundError(f"Reference audio for '{speaker_id}' not found at: {path}")
 
-            tmp_input_wav_path = tempfile.mktemp(suffix=f"_{speaker_id}.wav", dir=tool_path)
-            temp_files_to_clean.append(tmp_input_wav_path)
-            # Use ffmpeg to convert any input audio to the required format for the model
-            ffmpeg.input(path).output(tmp_input_wav_path, acodec='pcm_s16le', ar=24000).run(overwrite_output=True, quiet=True)
-            speaker_temp_wavs[speaker_id] = tmp_input_wav_path
+            if is_reference_ready(path):
+                speaker_temp_wavs[speaker_id] = path
+                continue
+
+            # Converted references are kept in the tool folder, so a speaker is only converted once.
+            # The conversion writes a temp name next to the cache entry (same filesystem) and is renamed
+            # into place afterwards.
+            cache_path = get_reference_cache_path(tool_path, path)
+            speaker_temp_wavs[speaker_id] = cache_path
+            if os.path.exists(cache_path):
+                # Marks the entry as recently used for prune_speaker_cache().
+                os.utime(cache_path)
+                continue
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            tmp_input_wav_path = f"{cache_path[:-4]}.{os.getpid()}.tmp.wav"
+            stack.callback(remove_temp_file, tmp_input_wav_path)
+            conversions.append((path, tmp_input_wav_path, cache_path))
+
+        # Each conversion is file I/O plus native decode/resample code that releases the GIL,
+        # so speakers are prepared concurrently rather than one after another.
+        if conversions:
+            device = get_device()
+            max_workers = min(len(conversions), CPU_THREADS)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [
+                    executor.submit(prepare_reference_audio, source_path, output_path, device)
+                    for source_path, output_path, _ in conversions
+                ]
+                for future in futures:
+                    future.result()
+            for _, output_path, cache_path in conversions:
+                os.replace(output_path, cache_path)
+            # The cache only grows here, so this is where it is trimmed back to its size limit.
+            prune_speaker_cache(os.path.dirname(conversions[0][2]), keep=speaker_temp_wavs.values())
 
         # --- 4. Generate Audio for Each Script Line ---
-        model = ChatterboxTTS.from_pretrained(device="cpu")
-        generated_wav_segments = []
-        
-        path_root, path_ext = os.path.splitext(final_output_path)
+        device = get_device()
+        model = load_model(device)
+        inference_context = get_inference_context(device)
 
+        segment_order = []
         for i, item in enumerate(tts_script):
-            text = item.get("text")
-            speaker_path = item.get("speaker_audio_path")
-            if not text or not speaker_path:
+            if not item.get("text") or not item.get("speaker_audio_path"):
                 print(f"Skipping item {i+1} due to missing text or speaker path.")
                 continue
+            segment_order.append(i)
 
-            speaker_id = speakers_dict[speaker_path]
-            reference_wav_path = speaker_temp_wavs.get(speaker_id)
-            if not reference_wav_path:
-                raise ValueError(f"Could not find processed reference wav for speaker '{speaker_id}'.")
-
-            print(f"Generating segment {i+1}/{len(tts_script)} for speaker '{speaker_id}': '{text[:50]}...'")
-            wav = model.generate(
-                text,
-                audio_prompt_path=reference_wav_path,
-                exaggeration=item.get("exaggeration", 0.5),
-                cfg_weight=item.get("cfg_weight", 0.5),
-                temperature=0.7
-            )
-
-            tmp_segment_path = f"{path_root}_temp_{i+1}.wav"
-            temp_files_to_clean.append(tmp_segment_path)
-            ta.save(tmp_segment_path, wav, model.sr)
-            generated_wav_segments.append(tmp_segment_path)
-
-        # --- 5. Combine Segments and Finalize ---
-        if not generated_wav_segments:
+        if not segment_order:
             raise ValueError("No audio segments were generated. Check input data.")
 
-        if len(generated_wav_segments) == 1:
-            print("Only one segment generated. Converting directly to final format.")
-            # Let ffmpeg infer the codec from the output file extension
-            ffmpeg.input(generated_wav_segments[0]).output(final_output_path).run(overwrite_output=True, quiet=True)
+        # --- 5. Stream Segments into the Encoder ---
+        # One ffmpeg process encodes raw PCM from stdin while later lines are still being generated,
+        # so no per-segment WAVs or concat list are written.
+        # Speaker conditionals are computed once per speaker (and kept across requests by a persistent worker)
+        # and swapped in per line; generate() itself re-applies each line's exaggeration on top of them,
+        # so lines can be processed in script order.
+        speaker_conds = {}
+        # WAV output is the PCM itself plus a header, so it is written directly and ffmpeg is skipped.
+        use_copy = final_output_path.lower().endswith(".wav")
+        if use_copy:
+            wav_writer = stack.enter_context(wave.open(final_output_path, "wb"))
+            wav_writer.setnchannels(1)
+            wav_writer.setsampwidth(2)
+            wav_writer.setframerate(model.sr)
+            encoder = None
+            write_pcm = wav_writer.writeframesraw
         else:
-            list_file_path = tempfile.mktemp(suffix=".txt", dir=tool_path)
-            temp_files_to_clean.append(list_file_path)
-            with open(list_file_path, "w", encoding='utf-8') as f:
-                for wav_path in generated_wav_segments:
-                    safe_path = wav_path.replace("\\", "/").replace("'", "'\\''")
-                    f.write(f"file '{safe_path}'\n")
+            encoder = open_pcm_encoder(final_output_path, model.sr)
+            write_pcm = encoder.stdin.write
+        # A single writer thread feeds the output, so generation never stalls on a full pipe buffer
+        # and the encoder works on earlier segments while the model generates the next one.
+        writer = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        writes = collections.deque()
+        try:
+            for i in segment_order:
+                item = tts_script[i]
+                speaker_id = speakers_dict[item["speaker_audio_path"]]
+                exaggeration = item.get("exaggeration", 0.5)
+                if speaker_id in speaker_conds:
+                    model.conds = speaker_conds[speaker_id]
+                else:
+                    reference_wav_path = speaker_temp_wavs.get(speaker_id)
+                    if not reference_wav_path:
+                        raise ValueError(f"Could not find processed reference wav for speaker '{speaker_id}'.")
+                    model.conds = get_speaker_conds(
+                        model, device, item["speaker_audio_path"], reference_wav_path, exaggeration
+                    )
+                    speaker_conds[speaker_id] = model.conds
+
+                text = item["text"]
+                print(f"Generating segment {i+1}/{len(tts_script)} for speaker '{speaker_id}': '{text[:50]}...'")
+                with torch.inference_mode(), inference_context():
+                    wav = model.generate(
+                        text,
+                        exaggeration=exaggeration,
+                        cfg_weight=item.get("cfg_weight", 0.5),
+                        temperature=0.7
+                    )
+                    pcm = pcm16_bytes(wav)
 
-            print(f"Concatenating {len(generated_wav_segments)} segments into final file: {final_output_path}")
-            # Let ffmpeg infer the codec from the output file extension
-            ffmpeg.input(list_file_path, format='concat', safe=0).output(final_output_path).run(overwrite_output=True, quiet=True)
+                writes.append(writer.submit(write_pcm, pcm))
+                # Re-raise write failures as soon as they happen rather than after the whole script.
+                while writes and writes[0].done():
+                    writes.popleft().result()
+
+            while writes:
+                writes.popleft().result()
+            print(f"Finalizing {len(segment_order)} segment(s) into: {final_output_path}")
+            if use_copy:
+                wav_writer.close()
+            else:
+                finish_pcm_encoder(encoder)
+        except BrokenPipeError:
+            # ffmpeg exited early; surface its own error message instead. Without an encoder (WAV output)
+            # the broken pipe is unrelated to the output and is re-raised as it is.
+            if encoder is not None:
+                finish_pcm_encoder(encoder)
+            raise
+        finally:
+            if encoder is not None and encoder.poll() is None:
+                encoder.kill()
+                encoder.wait()
+            writer.shutdown(wait=True, cancel_futures=True)
 
         # --- 6. Return Success Output ---
-        sys.stdout = original_stdout
-        result = {
+        return {
             "status": "success",
-            "message": f"Audio processing completed. {len(generated_wav_segments)} segment(s) processed.",
+            "message": f"Audio processing completed. {len(segment_order)} segment(s) processed.",
             "output_file": final_output_path
         }
-        print(json.dumps(result, indent=4))
+
+
+def main(input_data, tool_path):
+    """
+    Main function to handle TTS generation for single or batch items.
+    """
+    # Redirect print() to stderr for logging, so stdout is clean for n8n JSON output
+    original_stdout = sys.stdout
+    sys.stdout = sys.stderr
+
+    try:
+        result = generate_speech(input_data, tool_path)
+        sys.stdout = original_stdout
+        write_json(result)
 
     except Exception as e:
         sys.stdout = original_stdout
@@ -189,22 +576,50 @@ def main(input_data, tool_path):
         sys.exit(1)
 
     finally:
-        # --- 7. Cleanup ---
         sys.stdout = original_stdout
-        for file_path in temp_files_to_clean:
-            if os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                except OSError as e:
-                    print(f"Warning: Could not remove temp file '{file_path}': {e}", file=sys.stderr)
+
+
+def serve(tool_path):
+    """
+    Persistent worker loop: answers one newline-delimited JSON request per line until stdin closes.
+    The model stays loaded in _MODEL_CACHE between requests.
+    """
+    # stdout is the response channel, but the background model load can print at any time (the
+    # watermarker announces itself, for one). For the whole worker lifetime, file descriptor 1 and
+    # sys.stdout therefore point at stderr, and responses go to a private duplicate of the real stdout.
+    sys.stdout.flush()
+    protocol_out = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    original_stdout = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        # Load (and compile) the model while waiting for the first request, which meanwhile prepares its
+        # speaker references; load_model() blocks that request only for whatever loading time remains.
+        if ChatterboxTTS is not None:
+            threading.Thread(target=warm_up_model, daemon=True).start()
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            try:
+                result = generate_speech(json_loads(line), tool_path)
+            except Exception as e:
+                result = {"status": "error", "message": str(e)}
+            write_json(result, protocol_out)
+    finally:
+        sys.stdout = original_stdout
+        protocol_out.close()
 
 
 # --- Boilerplate for Direct Execution ---
 if __name__ == "__main__":
+    if "--serve" in sys.argv[1:]:
+        serve(os.environ.get("SUBCOMMAND_TOOL_PATH", tempfile.gettempdir()))
+        sys.exit(0)
+
     stdin_content = sys.stdin.read()
     if stdin_content:
         try:
-            input_json = json.loads(stdin_content)
+            input_json = json_loads(stdin_content)
             subcommand_tool_path = os.environ.get("SUBCOMMAND_TOOL_PATH", tempfile.gettempdir())
             main(input_json, subcommand_tool_path)
         except json.JSONDecodeError:
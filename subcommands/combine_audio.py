@@ -1,13 +1,42 @@
 import sys
 import os
 import json
-import datetime
+import time
+import functools
+import concurrent.futures
+import subprocess
+import tempfile
+import shutil
+
+# NumPy is only installed in this subcommand's environment; the guard keeps the file importable without it,
+# and the original error is reported when the mixer needs NumPy.
+_NUMPY_IMPORT_ERROR = None
+try:
+    import numpy as np
+except ImportError as e:
+    np = None
+    _NUMPY_IMPORT_ERROR = e
+
+# The Numba kernels in _kernels.py are optional: transitions fall back to plain NumPy without them.
+try:
+    import _kernels
+except ImportError:
+    _kernels = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+json_loads = orjson.loads if orjson is not None else json.loads
 
 # --- Required Metadata ---
 
 # 1. DEPENDENCIES
 REQUIRES = [
-    "pydub",
+    "numpy",
+    "numba",
+    "orjson",
 ]
 
 # 2. N8N UI SCHEMA
@@ -55,9 +84,17 @@ INPUT_SCHEMA = [
 
 # --- Helper Functions ---
 
+def write_json(result):
+    """Writes a result to stdout as indented JSON, serialized by orjson when available."""
+    if orjson is not None:
+        sys.stdout.buffer.write(orjson.dumps(result, option=orjson.OPT_INDENT_2) + b"\n")
+    else:
+        sys.stdout.write(json.dumps(result, indent=2) + "\n")
+    sys.stdout.flush()
+
 def generate_output_filename():
     """Generate a unique filename for the output file"""
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    timestamp = time.strftime("%Y%m%d_%H%M%S")
     return f"combined_audio_{timestamp}.mp3"
 
 def resolve_path(output_path):
@@ -68,17 +105,227 @@ def resolve_path(output_path):
     else:
         resolved_path = output_path
     
+    # A bare filename has no directory part, and makedirs('') would raise.
     output_dir = os.path.dirname(resolved_path)
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
     return resolved_path
 
+# Every track is decoded to this common format so segments can be mixed sample-for-sample.
+SAMPLE_RATE = 44100
+CHANNELS = 2
+
+def ms_to_frames(duration_ms):
+    """Converts a duration in milliseconds to a frame count at SAMPLE_RATE."""
+    return int(round(duration_ms * SAMPLE_RATE / 1000))
+
+def frames_to_ms(frames):
+    """Converts a frame count at SAMPLE_RATE to whole milliseconds."""
+    return int(frames * 1000 // SAMPLE_RATE)
+
+@functools.lru_cache(maxsize=64)
+def _decode_audio(path, mtime_ns, max_frames):
+    """Decodes 'path' once per (path, modification time, limit); repeated intros and stingers reuse the result."""
+    # -nostdin: decodes never read stdin, and an inherited one could otherwise be consumed by ffmpeg.
+    command = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin", "-i", path]
+    if max_frames is not None:
+        # Output-side -t stops decoding once enough audio has been produced; the small margin absorbs
+        # resampler rounding so the slice below is always full length when the file is long enough.
+        command += ["-t", f"{(max_frames + 1024) / SAMPLE_RATE:.6f}"]
+    command += ["-f", "f32le", "-ac", str(CHANNELS), "-ar", str(SAMPLE_RATE), "pipe:1"]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not decode '{path}': {result.stderr.decode('utf-8', errors='replace').strip()}")
+    audio = np.frombuffer(result.stdout, dtype=np.float32).reshape(-1, CHANNELS)
+    return audio if max_frames is None else audio[:max_frames]
+
+def load_audio(path, max_frames=None):
+    """
+    Decodes an audio file with ffmpeg into a float32 array of shape (frames, CHANNELS), optionally
+    only its first 'max_frames' frames. The array is shared with the decode cache and read-only;
+    transitions work on copies.
+    """
+    path = os.path.abspath(path)
+    return _decode_audio(path, os.stat(path).st_mtime_ns, max_frames)
+
+# Upper bound on concurrent ffmpeg decodes.
+MAX_DECODE_WORKERS = 8
+
+def load_tracks(requests):
+    """
+    Decodes a list of (path, max_frames) pairs concurrently and returns the arrays in the same order.
+    Every decode is its own ffmpeg process, so threads overlap them; repeated entries are decoded once.
+    """
+    unique_requests = list(dict.fromkeys(requests))
+    max_workers = min(MAX_DECODE_WORKERS, os.cpu_count() or 1, len(unique_requests))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        decoded = dict(zip(unique_requests, executor.map(lambda request: load_audio(*request), unique_requests)))
+    return [decoded[request] for request in requests]
+
+@functools.lru_cache(maxsize=32)
+def linear_ramp(frames):
+    """Returns a read-only (frames, 1) gain ramp from 0 to 1, shared by every fade of the same length."""
+    ramp = np.linspace(0.0, 1.0, frames, dtype=np.float32)[:, None]
+    ramp.setflags(write=False)
+    return ramp
+
+def apply_fades(audio, fade_in_frames=0, fade_out_frames=0):
+    """
+    Applies a linear fade-in over the first 'fade_in_frames' frames and a fade-out over the last
+    'fade_out_frames' frames in one pass. Works in place when 'audio' is writable (an intermediate
+    mix); read-only arrays from the decode cache are copied once.
+    """
+    if not fade_in_frames and not fade_out_frames:
+        return audio
+    if not audio.flags.writeable:
+        audio = audio.copy()
+    if _kernels is not None:
+        if fade_in_frames:
+            _kernels.fade_in_inplace(audio, fade_in_frames)
+        if fade_out_frames:
+            _kernels.fade_out_inplace(audio, fade_out_frames)
+        return audio
+    if fade_in_frames:
+        audio[:fade_in_frames] *= linear_ramp(fade_in_frames)
+    if fade_out_frames:
+        audio[audio.shape[0] - fade_out_frames:] *= linear_ramp(fade_out_frames)[::-1]
+    return audio
+
+def crossfade_in_place(tail, head):
+    """
+    Blends 'head' into 'tail' (equally long frame blocks) with a linear crossfade, writing the result
+    over 'tail'. Used on a slice of the preallocated mix, so the join needs no new buffers.
+    """
+    if _kernels is not None:
+        _kernels.crossfade_inplace(tail, head)
+    else:
+        ramp = linear_ramp(tail.shape[0])
+        tail *= 1.0 - ramp
+        tail += head * ramp
+
+# Frames handed to the encoder per write (1 MiB of float32 stereo samples).
+EXPORT_CHUNK_FRAMES = (1 << 20) // (4 * CHANNELS)
+
+def export_audio(audio, output_path):
+    """
+    Encodes the float samples to 'output_path' with ffmpeg, which picks the codec from the extension.
+    Samples are clipped and written in chunks, so ffmpeg starts encoding immediately and no full-length
+    copy of the mix is made.
+    """
+    command = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "f32le", "-ar", str(SAMPLE_RATE), "-ac", str(CHANNELS), "-i", "pipe:0",
+        "-threads", "0",
+    ]
+    if output_path.lower().endswith(".mp3"):
+        # LAME VBR quality 2 encodes faster than the default 128k CBR and sounds better.
+        command += ["-c:a", "libmp3lame", "-q:a", "2"]
+    command.append(output_path)
+    encoder = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        for start in range(0, audio.shape[0], EXPORT_CHUNK_FRAMES):
+            # Mixed regions can exceed full scale; clip like pydub's saturating overlay instead of wrapping.
+            chunk = np.clip(audio[start:start + EXPORT_CHUNK_FRAMES], -1.0, 1.0)
+            encoder.stdin.write(chunk.data)
+    except BrokenPipeError:
+        # ffmpeg exited early; its own error message is reported below.
+        pass
+    _, stderr = encoder.communicate()
+    if encoder.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to export '{output_path}': {stderr.decode('utf-8', errors='replace').strip()}")
+
+def probe_audio_stream(path):
+    """
+    Returns ((codec, sample_rate, channels), duration_seconds) for a file's first audio stream via ffprobe,
+    or None if it cannot be probed.
+    """
+    command = [
+        "ffprobe", "-v", "error", "-select_streams", "a:0",
+        "-show_entries", "stream=codec_name,sample_rate,channels:format=duration", "-of", "json", path
+    ]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    if result.returncode != 0:
+        return None
+    info = json_loads(result.stdout)
+    if not info.get("streams"):
+        return None
+    stream = info["streams"][0]
+    try:
+        duration = float(info.get("format", {}).get("duration"))
+    except (TypeError, ValueError):
+        return None
+    return (stream.get("codec_name"), stream.get("sample_rate"), stream.get("channels")), duration
+
+def try_stream_copy_concat(items, output_path):
+    """
+    Joins MP3 files whose items all use plain 'append' by copying their frames with ffmpeg's concat
+    demuxer, with no decode or re-encode. Returns the total duration in seconds, or None when the batch
+    does not qualify (other transitions, mixed formats) or the copy fails, so the caller mixes normally.
+    """
+    paths = [item.get("file") for item in items]
+    if not output_path.lower().endswith(".mp3") or not all(path.lower().endswith(".mp3") for path in paths):
+        return None
+    if any(item.get("transition_type", "append") != "append" for item in items):
+        return None
+    # ffmpeg only refuses to overwrite its direct inputs, not files named in a concat list; writing over an
+    # input would truncate it mid-read, so the mixer (which decodes every input first) handles this case.
+    if os.path.exists(output_path) and any(
+        os.path.exists(path) and os.path.samefile(path, output_path) for path in paths
+    ):
+        return None
+
+    unique_paths = list(dict.fromkeys(paths))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(MAX_DECODE_WORKERS, len(unique_paths))) as executor:
+        probes = dict(zip(unique_paths, executor.map(probe_audio_stream, unique_paths)))
+    if any(probe is None for probe in probes.values()):
+        return None
+    formats = {probe[0] for probe in probes.values()}
+    if len(formats) != 1 or next(iter(formats))[0] != "mp3":
+        return None
+
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False, encoding="utf-8") as list_file:
+        for path in paths:
+            escaped_path = os.path.abspath(path).replace("'", "'\\''")
+            list_file.write(f"file '{escaped_path}'\n")
+    try:
+        command = [
+            "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin", "-y",
+            "-f", "concat", "-safe", "0", "-i", list_file.name,
+            "-map", "0:a", "-c", "copy", output_path
+        ]
+        result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    finally:
+        os.remove(list_file.name)
+    if result.returncode != 0:
+        print(f"Warning: Stream copy failed, re-encoding instead: {result.stderr.decode('utf-8', errors='replace').strip()}", file=sys.stderr)
+        return None
+    return sum(probes[path][1] for path in paths)
+
+def try_passthrough_copy(source_path, output_path):
+    """
+    Copies a single untouched track straight to the output when both share a file extension, so no
+    decode or re-encode happens. Returns the duration in seconds, or None when the file cannot be probed
+    or the extensions differ, in which case the caller encodes as usual.
+    """
+    if os.path.splitext(source_path)[1].lower() != os.path.splitext(output_path)[1].lower():
+        return None
+    if os.path.exists(output_path) and os.path.samefile(source_path, output_path):
+        return None
+    probe = probe_audio_stream(source_path)
+    if probe is None:
+        return None
+    shutil.copyfile(source_path, output_path)
+    return probe[1]
+
 def apply_and_combine(items):
     """
     Applies transitions and effects, now with robust duration handling and improved output.
+    Audio is decoded to float32 NumPy arrays, mixed with vectorized operations and encoded once by ffmpeg.
     """
-    from pydub import AudioSegment
-
+    if np is None:
+        raise ImportError(
+            f"NumPy could not be imported ({_NUMPY_IMPORT_ERROR}). Run 'python manager.py update'."
+        ) from _NUMPY_IMPORT_ERROR
     if not items:
         raise ValueError("No items were provided to process.")
 
@@ -86,121 +333,182 @@ def apply_and_combine(items):
     if len(items) == 1:
         item = items[0]
         final_output_path = resolve_path(item.get("output_path"))
-        audio = AudioSegment.from_file(item.get("file"))
-        
         transition_type = item.get("transition_type", "append")
-        duration_ms = int(item.get("transition_duration", 2.0) * 1000)
 
         print(f"Processing single item with effect: '{transition_type}'", file=sys.stderr)
 
-        if duration_ms > len(audio):
-            print(f"Warning: Duration ({duration_ms}ms) is longer than the audio clip ({len(audio)}ms). Capping duration.", file=sys.stderr)
-            duration_ms = len(audio)
+        # Only fades change a lone track; anything else is returned as-is, so the file itself is copied.
+        if transition_type not in ["fadein", "fadeout", "dual-fade", "crossfade"]:
+            copied_duration = try_passthrough_copy(item.get("file"), final_output_path)
+            if copied_duration is not None:
+                print(f"Copied unmodified file to: {final_output_path}", file=sys.stderr)
+                return {
+                    "status": "success",
+                    "message": "Single file processed successfully.",
+                    "output_file": final_output_path,
+                    "total_duration_seconds": round(copied_duration, 2),
+                    "processed_files_count": 1,
+                }
+
+        audio = load_audio(item.get("file"))
+        duration_ms = int(item.get("transition_duration", 2.0) * 1000)
 
-        if transition_type in ["fadein", "dual-fade"]:
-            audio = audio.fade_in(duration_ms)
-        if transition_type in ["fadeout", "dual-fade", "crossfade"]:
-            audio = audio.fade_out(duration_ms)
+        if duration_ms > frames_to_ms(audio.shape[0]):
+            print(f"Warning: Duration ({duration_ms}ms) is longer than the audio clip ({frames_to_ms(audio.shape[0])}ms). Capping duration.", file=sys.stderr)
+        duration_frames = min(ms_to_frames(duration_ms), audio.shape[0])
+
+        audio = apply_fades(
+            audio,
+            fade_in_frames=duration_frames if transition_type in ["fadein", "dual-fade"] else 0,
+            fade_out_frames=duration_frames if transition_type in ["fadeout", "dual-fade", "crossfade"] else 0,
+        )
         
-        # UPDATED: Dynamically determine output format from file extension
-        output_format = os.path.splitext(final_output_path)[1][1:]
         print(f"Exporting single processed file to: {final_output_path}", file=sys.stderr)
-        audio.export(final_output_path, format=output_format)
+        export_audio(audio, final_output_path)
         return {
             "status": "success",
             "message": "Single file processed successfully.",
             "output_file": final_output_path,
-            "total_duration_seconds": round(len(audio) / 1000, 2),
+            "total_duration_seconds": round(audio.shape[0] / SAMPLE_RATE, 2),
             "processed_files_count": 1,
         }
 
     # --- Batch Processing Logic ---
     final_output_path = resolve_path(items[0].get("output_path"))
 
+    # Plain appends of matching MP3s need no mixing at all: their frames are copied into the output.
+    copied_duration = try_stream_copy_concat(items, final_output_path)
+    if copied_duration is not None:
+        print(f"Stream-copied {len(items)} MP3 tracks into: {final_output_path}", file=sys.stderr)
+        return {
+            "status": "success",
+            "message": f"{len(items)} tracks combined successfully.",
+            "output_file": final_output_path,
+            "total_duration_seconds": round(copied_duration, 2),
+            "processed_files_count": len(items),
+        }
+
+    # Every item's transition settings are read once; index i-1 describes the join into track i.
+    transition_types = [item.get("transition_type", "append") for item in items]
+    durations_ms = [int(item.get("transition_duration", 2.0) * 1000) for item in items]
+
+    # Decode limits only depend on item settings, so every track is decoded concurrently up front.
+    # An overlap keeps only the head of the next track, so that track is decoded no further than the
+    # transition and its fade-in can use; capping below sees the same lengths as with the full file.
+    decode_requests = [(items[0].get("file"), None)]
+    for i in range(1, len(items)):
+        max_frames = None
+        if transition_types[i-1] == "overlap":
+            max_frames = max(ms_to_frames(durations_ms[i-1]), ms_to_frames(durations_ms[i]))
+        decode_requests.append((items[i].get("file"), max_frames))
+    decoded_tracks = load_tracks(decode_requests)
+
+    # Pass 1: plan each join, so the length of the mix is known before it is built.
     first_item = items[0]
-    combined_audio = AudioSegment.from_file(first_item.get("file"))
-    first_transition_type = first_item.get("transition_type", "append")
-    first_duration_ms = int(first_item.get("transition_duration", 2.0) * 1000)
+    first_audio = decoded_tracks[0]
+    first_transition_type = transition_types[0]
+    first_duration_ms = durations_ms[0]
 
     if first_transition_type in ["fadein", "dual-fade"]:
-        safe_duration = min(first_duration_ms, len(combined_audio))
+        safe_frames = min(ms_to_frames(first_duration_ms), first_audio.shape[0])
         print(f"Applying initial '{first_transition_type}' to {first_item.get('file')}", file=sys.stderr)
-        combined_audio = combined_audio.fade_in(safe_duration)
+        first_audio = apply_fades(first_audio, fade_in_frames=safe_frames)
 
+    tracks = [first_audio]
+    joins = []
+    total_frames = first_audio.shape[0]
     for i in range(1, len(items)):
-        previous_item = items[i-1]
         current_item = items[i]
         
-        transition_type = previous_item.get("transition_type", "append")
-        duration_ms = int(previous_item.get("transition_duration", 2.0) * 1000)
+        transition_type = transition_types[i-1]
+        duration_ms = durations_ms[i-1]
+        duration_frames = ms_to_frames(duration_ms)
         
-        current_audio = AudioSegment.from_file(current_item.get("file"))
+        current_transition_type = transition_types[i]
+        current_duration_ms = durations_ms[i]
+        current_audio = decoded_tracks[i]
 
-        safe_duration_ms = min(duration_ms, len(combined_audio), len(current_audio))
-        if safe_duration_ms < duration_ms:
-            print(f"Warning: Transition duration ({duration_ms}ms) is too long. Capping to {safe_duration_ms}ms.", file=sys.stderr)
+        safe_frames = min(duration_frames, total_frames, current_audio.shape[0])
+        if safe_frames < duration_frames:
+            print(f"Warning: Transition duration ({duration_ms}ms) is too long. Capping to {frames_to_ms(safe_frames)}ms.", file=sys.stderr)
 
-        if transition_type in ["fadeout", "dual-fade"]:
-            print(f"Applying fade out from '{transition_type}' on {previous_item.get('file')}", file=sys.stderr)
-            combined_audio = combined_audio.fade_out(min(duration_ms, len(combined_audio)))
-        
-        current_transition_type = current_item.get("transition_type", "append")
-        current_duration_ms = int(current_item.get("transition_duration", 2.0) * 1000)
-        
         if current_transition_type in ["fadein", "dual-fade"]:
             print(f"Applying fade in from '{current_transition_type}' on {current_item.get('file')}", file=sys.stderr)
-            current_audio = current_audio.fade_in(min(current_duration_ms, len(current_audio)))
-            
-        print(f"Applying transition '{transition_type}' from {previous_item.get('file')} to {current_item.get('file')}", file=sys.stderr)
-        
+            current_audio = apply_fades(current_audio, fade_in_frames=min(ms_to_frames(current_duration_ms), current_audio.shape[0]))
+
         if transition_type == "crossfade":
-            combined_audio = combined_audio.append(current_audio, crossfade=safe_duration_ms)
-        elif transition_type == "overlap":
-            combined_audio = combined_audio.overlay(current_audio, position=len(combined_audio) - safe_duration_ms)
+            total_frames += current_audio.shape[0] - safe_frames
         elif transition_type == "silence":
-            combined_audio += AudioSegment.silent(duration=duration_ms) + current_audio
-        else:
-            combined_audio += current_audio
+            total_frames += duration_frames + current_audio.shape[0]
+        elif transition_type != "overlap":
+            total_frames += current_audio.shape[0]
+        tracks.append(current_audio)
+        joins.append((transition_type, duration_frames, safe_frames))
 
     last_item = items[-1]
-    final_transition_type = last_item.get("transition_type", "append")
-    final_duration_ms = int(last_item.get("transition_duration", 2.0) * 1000)
-    safe_final_duration_ms = min(final_duration_ms, len(combined_audio))
+    final_transition_type = transition_types[-1]
+    final_duration_ms = durations_ms[-1]
+    if final_transition_type == "silence":
+        total_frames += ms_to_frames(final_duration_ms)
+
+    # Pass 2: write every track into one zeroed buffer. Joins only touch slices of it, so the mix is
+    # built with O(total) copying, and silences are simply left as zeros.
+    combined_audio = np.zeros((total_frames, CHANNELS), dtype=np.float32)
+    end = first_audio.shape[0]
+    combined_audio[:end] = first_audio
 
+    for i in range(1, len(items)):
+        previous_item = items[i-1]
+        current_item = items[i]
+        current_audio = tracks[i]
+        transition_type, duration_frames, safe_frames = joins[i-1]
+
+        if transition_type in ["fadeout", "dual-fade"]:
+            print(f"Applying fade out from '{transition_type}' on {previous_item.get('file')}", file=sys.stderr)
+            apply_fades(combined_audio[:end], fade_out_frames=min(duration_frames, end))
+
+        print(f"Applying transition '{transition_type}' from {previous_item.get('file')} to {current_item.get('file')}", file=sys.stderr)
+
+        if transition_type == "crossfade":
+            crossfade_in_place(combined_audio[end - safe_frames:end], current_audio[:safe_frames])
+            remaining = current_audio.shape[0] - safe_frames
+            combined_audio[end:end + remaining] = current_audio[safe_frames:]
+            end += remaining
+        elif transition_type == "overlap":
+            # As with pydub's overlay, the mix keeps its length; the rest of the next track is dropped.
+            combined_audio[end - safe_frames:end] += current_audio[:safe_frames]
+        else:
+            if transition_type == "silence":
+                end += duration_frames
+            combined_audio[end:end + current_audio.shape[0]] = current_audio
+            end += current_audio.shape[0]
+
+    safe_final_frames = min(ms_to_frames(final_duration_ms), end)
     if final_transition_type in ["fadeout", "dual-fade", "crossfade"]:
         print(f"Applying final fade out from '{final_transition_type}' to {last_item.get('file')}", file=sys.stderr)
-        combined_audio = combined_audio.fade_out(safe_final_duration_ms)
+        apply_fades(combined_audio[:end], fade_out_frames=safe_final_frames)
     elif final_transition_type == "silence":
         print(f"Applying final silence to {last_item.get('file')}", file=sys.stderr)
-        combined_audio += AudioSegment.silent(duration=final_duration_ms)
+        # The trailing silence was planned into the buffer length and is already zeros.
         
-    # UPDATED: Dynamically determine output format from file extension
-    output_format = os.path.splitext(final_output_path)[1][1:]
     print(f"Exporting final combined audio to: {final_output_path}", file=sys.stderr)
-    combined_audio.export(final_output_path, format=output_format)
+    export_audio(combined_audio, final_output_path)
 
     return {
         "status": "success",
         "message": f"{len(items)} tracks combined successfully.",
         "output_file": final_output_path,
-        "total_duration_seconds": round(len(combined_audio) / 1000, 2),
+        "total_duration_seconds": round(combined_audio.shape[0] / SAMPLE_RATE, 2),
         "processed_files_count": len(items),
     }
 
 # --- Main Execution Logic ---
 
+# The option values n8n sends; anything else falls back to "append".
+TRANSITION_TYPES = frozenset({"append", "crossfade", "dual-fade", "fadein", "fadeout", "overlap", "silence"})
+
 def main(input_data, tool_path):
     try:
-        transition_map = {
-            "Append (Default if not chosen)": "append",
-            "Crossfade": "crossfade",
-            "Dual-Fade": "dual-fade",
-            "Fade In": "fadein",
-            "Fade Out": "fadeout",
-            "Overlap": "overlap",
-            "Silence": "silence",
-        }
-
         items_to_process = []
         if "@items" in input_data:
             items_to_process = input_data.get("@items", [])
@@ -213,12 +521,13 @@ def main(input_data, tool_path):
             raise ValueError("No items were provided to the subcommand.")
 
         for item in items_to_process:
-            human_readable_type = item.get("transition_type", "Append (Default if not chosen)")
-            item["transition_type"] = transition_map.get(human_readable_type, "append")
+            # Display labels such as "Fade In" or "Dual-Fade" normalize to their values as well.
+            transition_type = str(item.get("transition_type") or "append").lower().replace(" ", "")
+            item["transition_type"] = transition_type if transition_type in TRANSITION_TYPES else "append"
 
         result = apply_and_combine(items_to_process)
         
-        print(json.dumps(result, indent=2))
+        write_json(result)
 
     except Exception as e:
         error_message = {"status": "error", "message": str(e)}
@@ -231,7 +540,7 @@ if __name__ == "__main__":
     stdin_content = sys.stdin.read()
     if stdin_content:
         try:
-            data = json.loads(stdin_content)
+            data = json_loads(stdin_content)
             tool_folder = os.environ.get("SUBCOMMAND_TOOL_PATH", "")
             main(data, tool_folder)
         except json.JSONDecodeError:
@@ -1,12 +1,23 @@
 import sys
 import os
 import json
+import hashlib
+import mmap
+import struct
+import subprocess
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+json_loads = orjson.loads if orjson is not None else json.loads
 
 # --- Required Metadata ---
 
 # 1. DEPENDENCIES
 REQUIRES = [
-    "ffmpeg-python==0.2.0",
+    "orjson",
 ]
 
 # 2. N8N UI SCHEMA
@@ -35,6 +46,14 @@ INPUT_SCHEMA = [
 
 # --- Helper Functions ---
 
+def write_json(result):
+    """Writes a result to stdout as indented JSON, serialized by orjson when available."""
+    if orjson is not None:
+        sys.stdout.buffer.write(orjson.dumps(result, option=orjson.OPT_INDENT_2) + b"\n")
+    else:
+        sys.stdout.write(json.dumps(result, indent=2) + "\n")
+    sys.stdout.flush()
+
 def format_duration(seconds, format_type="seconds"):
     if format_type == "seconds": return f"{seconds:.2f}"
     hours, remainder = divmod(seconds, 3600)
@@ -43,17 +62,188 @@ def format_duration(seconds, format_type="seconds"):
     total_minutes = hours * 60 + minutes
     return f"{int(total_minutes)}m {seconds:.2f}s"
 
-def get_file_duration(file_path):
-    # CORRECT: Import required modules inside the function that uses them.
-    import ffmpeg
+def _mp4_duration(data):
+    """Reads the duration from the 'mvhd' box inside the top-level 'moov' box of an MP4/MOV file."""
+    def boxes(start, end):
+        offset = start
+        while offset + 8 <= end:
+            size, box_type = struct.unpack_from(">I4s", data, offset)
+            header = 8
+            if size == 1:
+                size = struct.unpack_from(">Q", data, offset + 8)[0]
+                header = 16
+            elif size == 0:
+                size = end - offset
+            if size < header or offset + size > end:
+                return
+            yield box_type, offset + header, offset + size
+            offset += size
+
+    for box_type, start, end in boxes(0, len(data)):
+        if box_type != b"moov":
+            continue
+        for child_type, child_start, child_end in boxes(start, end):
+            if child_type != b"mvhd":
+                continue
+            # Version 1 stores 64-bit creation/modification times and duration; version 0 uses 32 bits.
+            if data[child_start] == 1:
+                timescale, duration = struct.unpack_from(">IQ", data, child_start + 20)
+            else:
+                timescale, duration = struct.unpack_from(">II", data, child_start + 12)
+            # Fragmented files leave the duration at zero or all ones; ffprobe has to work those out.
+            if timescale and 0 < duration < (0xFFFFFFFF if data[child_start] == 0 else 0xFFFFFFFFFFFFFFFF):
+                return duration / timescale
+            return None
+    return None
+
+def _wav_duration(data):
+    """Reads the duration of a PCM WAV file from its RIFF 'fmt ' byte rate and 'data' chunk size."""
+    offset = 12
+    byte_rate = None
+    while offset + 8 <= len(data):
+        chunk_id, size = struct.unpack_from("<4sI", data, offset)
+        if chunk_id == b"fmt " and size >= 16:
+            byte_rate = struct.unpack_from("<I", data, offset + 16)[0]
+        elif chunk_id == b"data":
+            # Streamed WAVs leave the size unset; trust only sizes that fit in the file.
+            if not byte_rate or size in (0, 0xFFFFFFFF) or offset + 8 + size > len(data):
+                return None
+            return size / byte_rate
+        offset += 8 + size + (size & 1)
+    return None
+
+def _ebml_vint(data, offset, keep_marker=False):
+    """Decodes an EBML variable-length integer at 'offset'; returns (value, length), value None if unknown."""
+    first = data[offset]
+    length = 1
+    while length <= 8 and not first & (0x80 >> (length - 1)):
+        length += 1
+    if length > 8:
+        raise ValueError("Invalid EBML variable-length integer")
+    value = first if keep_marker else first & (0xFF >> length)
+    for byte in data[offset + 1:offset + length]:
+        value = (value << 8) | byte
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        value = None
+    return value, length
+
+def _ebml_elements(data, start, end):
+    """Yields (element_id, data_start, data_end) for the EBML elements between 'start' and 'end'."""
+    offset = start
+    while offset < end:
+        element_id, id_length = _ebml_vint(data, offset, keep_marker=True)
+        size, size_length = _ebml_vint(data, offset + id_length)
+        data_start = offset + id_length + size_length
+        data_end = end if size is None else data_start + size
+        if data_end > end:
+            return
+        yield element_id, data_start, data_end
+        offset = data_end
+
+def _mkv_duration(data):
+    """Reads the duration from Segment > Info of a Matroska/WebM file (Duration x TimestampScale)."""
+    for element_id, start, end in _ebml_elements(data, 0, len(data)):
+        if element_id != 0x18538067:  # Segment
+            continue
+        for child_id, child_start, child_end in _ebml_elements(data, start, end):
+            if child_id == 0x1F43B675:  # A Cluster before Info: leave the layout to ffprobe.
+                return None
+            if child_id != 0x1549A966:  # Info
+                continue
+            timestamp_scale, duration = 1000000, None
+            for info_id, info_start, info_end in _ebml_elements(data, child_start, child_end):
+                if info_id == 0x2AD7B1:  # TimestampScale, in nanoseconds per tick
+                    timestamp_scale = int.from_bytes(data[info_start:info_end], "big")
+                elif info_id == 0x4489:  # Duration, a float in ticks
+                    if info_end - info_start == 4:
+                        duration = struct.unpack_from(">f", data, info_start)[0]
+                    elif info_end - info_start == 8:
+                        duration = struct.unpack_from(">d", data, info_start)[0]
+            if duration and duration > 0:
+                return duration * timestamp_scale / 1e9
+            return None
+    return None
+
+def read_header_duration(file_path):
+    """
+    Reads the duration straight from the container header for MP4/MOV, WAV and Matroska/WebM files.
+    Returns None for other formats or headers that cannot be trusted, so the caller falls back to ffprobe.
+    """
+    try:
+        with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[4:8] in (b"ftyp", b"moov", b"free", b"mdat", b"wide", b"skip"):
+                return _mp4_duration(data)
+            if data[0:4] == b"RIFF" and data[8:12] == b"WAVE":
+                return _wav_duration(data)
+            if data[0:4] == b"\x1a\x45\xdf\xa3":
+                return _mkv_duration(data)
+    except (OSError, ValueError, IndexError, struct.error):
+        # Empty, truncated or malformed files are left to ffprobe's error reporting.
+        return None
+    return None
+
+def probe_duration(file_path, fast=True):
+    """
+    Asks ffprobe for the container duration only. In 'fast' mode ffprobe also stops analysing
+    streams early, which is enough for containers that record their duration up front.
+    Returns None when ffprobe runs but reports no duration.
+    """
+    command = ["ffprobe", "-v", "error"]
+    if fast:
+        command += ["-probesize", "500K", "-analyzeduration", "0"]
+    command += ["-show_entries", "format=duration", "-of", "default=nw=1:nk=1", file_path]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg error: {result.stderr.strip()}")
     try:
-        probe = ffmpeg.probe(file_path)
-        return float(probe["format"]["duration"])
-    except ffmpeg.Error as e:
-        raise RuntimeError(f"ffmpeg error: {e.stderr.decode('utf8').strip()}")
+        return float(result.stdout.strip())
+    except ValueError:
+        return None
+
+def get_probe_cache_path(tool_path, file_path):
+    """
+    Returns the cache file for this file's probed duration, or None when no tool folder is available.
+    The key covers the file's path, modification time and size, so replacing the file invalidates it.
+    """
+    if not tool_path:
+        return None
+    file_stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), file_stat.st_mtime_ns, file_stat.st_size)
+    digest = hashlib.blake2b(repr(key).encode("utf-8"), digest_size=16).hexdigest()
+    return os.path.join(tool_path, "probe_cache", digest[:2], f"{digest}.json")
+
+def get_file_duration(file_path, tool_path=None):
+    # Common containers store the duration in their header, which is cheaper to read than any cache.
+    duration = read_header_duration(file_path)
+    if duration is not None:
+        return duration
+
+    # Unchanged files return the stored duration without spawning ffprobe.
+    cache_path = get_probe_cache_path(tool_path, file_path)
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return float(json.load(f)["duration"])
+
+    try:
+        duration = probe_duration(file_path)
+        if duration is None:
+            # Formats whose duration is estimated from the streams need ffprobe's full analysis.
+            duration = probe_duration(file_path, fast=False)
+        if duration is None:
+            raise RuntimeError(f"ffprobe reported no duration for '{file_path}'")
+    except RuntimeError:
+        raise
     except Exception as e:
         raise RuntimeError(f"An unexpected error occurred: {str(e)}")
 
+    if cache_path:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"duration": duration}, f)
+        os.replace(tmp_path, cache_path)
+    return duration
+
 # --- Main Execution Logic ---
 
 def main(input_data, tool_path):
@@ -69,7 +259,7 @@ def main(input_data, tool_path):
         if not file_path or not os.path.exists(file_path):
             raise FileNotFoundError(f"File not found at '{file_path}'")
 
-        duration_seconds = get_file_duration(file_path)
+        duration_seconds = get_file_duration(file_path, tool_path)
         
         result = {
             "status": "success",
@@ -77,7 +267,7 @@ def main(input_data, tool_path):
             "duration_seconds": duration_seconds,
             "duration_formatted": format_duration(duration_seconds, format_type)
         }
-        print(json.dumps(result, indent=4))
+        write_json(result)
 
     except Exception as e:
         error_message = {"status": "error", "message": str(e)}
@@ -89,7 +279,7 @@ if __name__ == "__main__":
     stdin_content = sys.stdin.read()
     if stdin_content:
         try:
-            data = json.loads(stdin_content)
+            data = json_loads(stdin_content)
             tool_folder = os.environ.get("SUBCOMMAND_TOOL_PATH", "")
             main(data, tool_folder)
         except json.JSONDecodeError:
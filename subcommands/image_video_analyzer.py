@@ -4,13 +4,58 @@ import json
 import base64
 import logging
 import math
+import re
+import queue
+import threading
+import struct
+
+# Third-party modules are only installed in this subcommand's environment; the guards keep the file
+# importable without them, and the functions that need a module report the original import error.
+_IMPORT_ERRORS = {}
+try:
+    import requests
+except ImportError as e:
+    requests = None
+    _IMPORT_ERRORS["requests"] = e
+
+try:
+    import cv2
+except ImportError as e:
+    cv2 = None
+    _IMPORT_ERRORS["cv2"] = e
+
+try:
+    import numpy as np
+except ImportError as e:
+    np = None
+    _IMPORT_ERRORS["numpy"] = e
+
+def require_modules(*names):
+    """Raises an ImportError carrying the original failure when any of the named modules did not import."""
+    failures = [f"{name}: {_IMPORT_ERRORS[name]}" for name in names if name in _IMPORT_ERRORS]
+    if failures:
+        raise ImportError(f"Could not import {'; '.join(failures)}. Run 'python manager.py update'.")
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+json_loads = orjson.loads if orjson is not None else json.loads
+
+# PyTurboJPEG wraps the system libjpeg-turbo; when either is missing, frames are encoded by OpenCV.
+try:
+    from turbojpeg import TurboJPEG, TJSAMP_420
+    _TURBOJPEG = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    _TURBOJPEG = None
 
 # --- Required Metadata ---
 # This section defines the contract with the Media Manager framework.
 
 # 1. DEPENDENCIES
 # The manager will install these packages into a dedicated virtual environment.
-REQUIRES = ["requests", "opencv-python", "numpy"]
+REQUIRES = ["requests", "opencv-python", "numpy", "orjson", "PyTurboJPEG"]
 
 # 2. N8N UI SCHEMA
 # This defines the input fields for the n8n user interface.
@@ -44,29 +89,156 @@ INPUT_SCHEMA = [
 PROMPTS = {
     "image_analysis": "You are an expert image analyst. Analyze the following image and respond directly to the user's prompt.",
     "video_scene_analysis": "You are a video scene analyzer. The following image is a keyframe from a video. In a single, concise sentence, describe the primary action or subject in this frame. Do not add any preamble.",
+    "video_scene_batch_analysis": "You are a video scene analyzer. The following {count} images are sequential keyframes from a video. For each keyframe, in order, write one line of the form 'Frame N: <description>', where N runs from 1 to {count} and the description is a single, concise sentence about the primary action or subject in that frame. Do not add any preamble.",
     "video_chunk_summary": "You are a video summary assistant. The following is a list of sequential, one-sentence scene descriptions from a segment of a video. Synthesize these descriptions into a coherent paragraph that summarizes this video segment.",
     "video_final_analysis": "You are a helpful AI assistant. You will be given a detailed, chronologically-ordered summary of a video. Based *only* on this summary, answer the user's final question or request."
 }
 
 # --- Ollama Communication ---
+# Keyframes described per request; one multi-image prompt saves a round trip and prompt encode per frame.
+KEYFRAME_BATCH_SIZE = 4
+
+# Encoded batches allowed to wait for a free worker before decoding pauses.
+KEYFRAME_QUEUE_SIZE = 8
+
+# Keyframe queries in flight at once; matches the server's OLLAMA_NUM_PARALLEL slot count when set.
+OLLAMA_MAX_WORKERS = max(1, int(os.environ.get("OLLAMA_NUM_PARALLEL", "4")))
+
+_SESSION = None
+
+def get_session():
+    """Returns the process-wide requests.Session, so every query reuses a keep-alive connection."""
+    global _SESSION
+    if _SESSION is None:
+        _SESSION = requests.Session()
+        # One pooled connection per concurrent query avoids discarding connections under load.
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=OLLAMA_MAX_WORKERS)
+        _SESSION.mount("http://", adapter)
+    return _SESSION
+
 def query_ollama(payload):
     """Sends a payload to the Ollama API and returns the response."""
-    import requests
+    require_modules("requests")
     try:
-        response = requests.post("http://127.0.0.1:11434/api/generate", json=payload, timeout=600)
-        response.raise_for_status()
-        result = response.json()
+        if orjson is not None:
+            # Payloads carry megabytes of base64 image data; orjson serializes and parses them in C.
+            response = get_session().post(
+                "http://127.0.0.1:11434/api/generate", data=orjson.dumps(payload),
+                headers={"Content-Type": "application/json"}, timeout=600
+            )
+            response.raise_for_status()
+            result = orjson.loads(response.content)
+        else:
+            response = get_session().post("http://127.0.0.1:11434/api/generate", json=payload, timeout=600)
+            response.raise_for_status()
+            result = response.json()
         return result.get("response", "No response received.")
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, ValueError) as e:
+        # ValueError covers a reply that is not valid JSON, from either parser.
         # This will be caught and handled as an error in the calling function.
         raise ConnectionError(f"Error communicating with Ollama: {str(e)}")
 
 
+# --- Frame Encoding ---
+# gemma3's vision encoder works at 896px, so larger frames are shrunk before they are sent.
+MAX_FRAME_EDGE = 896
+JPEG_QUALITY = 80
+
+def encode_frame_jpeg(frame, max_edge=MAX_FRAME_EDGE):
+    """Downscales a BGR frame to at most 'max_edge' on its long side and returns the JPEG bytes."""
+    height, width = frame.shape[:2]
+    scale = max_edge / max(height, width)
+    if scale < 1.0:
+        frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    if _TURBOJPEG is not None:
+        return _TURBOJPEG.encode(frame, quality=JPEG_QUALITY, jpeg_subsample=TJSAMP_420)
+    _, buffer = cv2.imencode(
+        ".jpg", frame,
+        [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY, cv2.IMWRITE_JPEG_OPTIMIZE, 0, cv2.IMWRITE_JPEG_PROGRESSIVE, 0]
+    )
+    return buffer.tobytes()
+
+
+# Upper bound on keyframes sampled from one video; longer videos get a proportionally wider interval.
+MAX_KEYFRAMES = 120
+
+# Keyframe intervals at least this long are reached by seeking instead of reading every frame in between.
+# A seek decodes forward from the preceding I-frame, so it only pays off once the interval is well past a GOP.
+SEEK_INTERVAL_SECONDS = 10
+
+# Keyframes whose 64-bit difference hash is within this many bits of the last kept keyframe are skipped.
+DHASH_MAX_DISTANCE = 5
+
+def frame_dhash(frame):
+    """
+    Returns a 64-bit difference hash of a BGR frame: shrunk to 9x8 grey pixels, one bit per
+    horizontal neighbour comparison. Near-identical frames have hashes a few bits apart.
+    """
+    small = cv2.cvtColor(cv2.resize(frame, (9, 8), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+    return int.from_bytes(np.packbits(small[:, 1:] > small[:, :-1]).tobytes(), "big")
+
+
 # --- Image Analysis Logic ---
+# Image files above this size are shrunk before upload; smaller ones are sent untouched.
+LARGE_IMAGE_BYTES = 4 * 1024 * 1024
+# Long-edge limit for shrunk images, the largest input the vision models use natively.
+MAX_IMAGE_EDGE = 1792
+
+# JPEG start-of-frame markers (every SOFn except DHT 0xC4, JPG 0xC8 and DAC 0xCC) carry the image size.
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+def image_dimensions(image_data):
+    """
+    Returns (width, height) read from a PNG or JPEG header without decoding any pixels,
+    or None for other formats and malformed headers.
+    """
+    if image_data[:8] == b"\x89PNG\r\n\x1a\n" and image_data[12:16] == b"IHDR":
+        return struct.unpack(">II", image_data[16:24])
+    if image_data[:2] != b"\xff\xd8":
+        return None
+    offset = 2
+    while offset + 4 <= len(image_data):
+        if image_data[offset] != 0xFF:
+            return None
+        marker = image_data[offset + 1]
+        if marker == 0xFF:
+            # Fill byte before the marker.
+            offset += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            # Markers without a length field.
+            offset += 2
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            if offset + 9 > len(image_data):
+                return None
+            height, width = struct.unpack(">HH", image_data[offset + 5:offset + 9])
+            return width, height
+        if marker in (0xD9, 0xDA):
+            # End of image or start of scan before any frame header.
+            return None
+        offset += 2 + struct.unpack(">H", image_data[offset + 2:offset + 4])[0]
+    return None
+
 def analyze_image(file_path, prompt):
     """Analyzes a single image file."""
     with open(file_path, "rb") as f:
         image_data = f.read()
+
+    if len(image_data) > LARGE_IMAGE_BYTES and cv2 is not None and np is not None:
+        # Half-resolution decoding is only used when the result still covers MAX_IMAGE_EDGE, so it never
+        # upscales. libjpeg decodes at half scale directly (skipping most of the IDCT work); libpng has no
+        # reduced decode, so OpenCV decodes PNGs at full size and shrinks them, which only saves memory.
+        dimensions = image_dimensions(image_data)
+        if dimensions is not None and max(dimensions) >= 2 * MAX_IMAGE_EDGE:
+            read_flag = cv2.IMREAD_REDUCED_COLOR_2
+        else:
+            read_flag = cv2.IMREAD_COLOR
+        # encode_frame_jpeg() brings the long edge down to MAX_IMAGE_EDGE either way.
+        image = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), read_flag)
+        # Formats OpenCV cannot decode are still sent as they are.
+        if image is not None:
+            image_data = encode_frame_jpeg(image, max_edge=MAX_IMAGE_EDGE)
     image_b64 = base64.b64encode(image_data).decode("utf-8")
 
     payload = {
@@ -85,7 +257,7 @@ def analyze_video_hierarchically(file_path, user_prompt, keyframe_interval_secon
     Analyzes a video using a multi-level summarization approach to handle
     long videos without exceeding the model's context window.
     """
-    import cv2
+    require_modules("cv2", "numpy")
 
     cap = cv2.VideoCapture(file_path)
     if not cap.isOpened():
@@ -95,35 +267,111 @@ def analyze_video_hierarchically(file_path, user_prompt, keyframe_interval_secon
     frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
     duration_seconds = frame_count / fps
     
-    keyframe_interval_frames = int(keyframe_interval_seconds * fps)
+    # Long videos are sampled more sparsely, so the number of model queries stays bounded by MAX_KEYFRAMES.
+    effective_interval_seconds = max(keyframe_interval_seconds, duration_seconds / MAX_KEYFRAMES)
+    # At least one frame, or intervals shorter than a frame would never advance.
+    keyframe_interval_frames = max(1, int(effective_interval_seconds * fps))
     
-    scene_descriptions = []
-    current_frame_num = 0
-
-    # Level 1: Analyze individual keyframes to get scene descriptions
-    while cap.isOpened():
-        cap.set(cv2.CAP_PROP_POS_FRAMES, current_frame_num)
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        _, buffer = cv2.imencode(".jpg", frame)
-        frame_b64 = base64.b64encode(buffer).decode("utf-8")
-        
+    # Level 1: Describe keyframes in batches; each batch is independent of the others
+    def describe_keyframe(frame_b64):
         payload = {
             "model": "gemma3:4b",
             "prompt": PROMPTS['video_scene_analysis'],
             "images": [frame_b64],
             "stream": False
         }
-        scene_desc = query_ollama(payload)
-        scene_descriptions.append(scene_desc.strip())
-        
-        current_frame_num += keyframe_interval_frames
-        if current_frame_num >= frame_count:
-            break
-    
-    cap.release()
+        return query_ollama(payload).strip()
+
+    def describe_keyframe_batch(batch):
+        if len(batch) == 1:
+            return [describe_keyframe(batch[0])]
+        payload = {
+            "model": "gemma3:4b",
+            "prompt": PROMPTS['video_scene_batch_analysis'].format(count=len(batch)),
+            "images": batch,
+            "stream": False
+        }
+        lines = re.findall(r"Frame\s*(\d+)\s*:\s*(.+)", query_ollama(payload))
+        if [int(number) for number, _ in lines] == list(range(1, len(batch) + 1)):
+            return [desc.strip(" *") for _, desc in lines]
+        # The reply did not describe every frame exactly once; ask for each frame on its own instead.
+        return [describe_keyframe(frame_b64) for frame_b64 in batch]
+
+    # Decoding (below, on this thread) and model queries (worker threads) run as a pipeline: the bounded
+    # queue lets decoding run ahead of inference by a few batches without holding the whole video in memory.
+    batch_queue = queue.Queue(maxsize=KEYFRAME_QUEUE_SIZE)
+    batch_results = {}
+    errors = []
+
+    def consume_batches():
+        while True:
+            job = batch_queue.get()
+            try:
+                if job is None:
+                    return
+                batch_index, batch = job
+                # After a failure, the remaining batches are drained without querying.
+                if not errors:
+                    batch_results[batch_index] = describe_keyframe_batch(batch)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                batch_queue.task_done()
+
+    workers = [threading.Thread(target=consume_batches, daemon=True) for _ in range(OLLAMA_MAX_WORKERS)]
+    for worker in workers:
+        worker.start()
+
+    def read_keyframes():
+        # A container that reports no frame count cannot be stepped through by time, so it is read sequentially.
+        if frame_count > 0 and effective_interval_seconds >= SEEK_INTERVAL_SECONDS:
+            # Sparse keyframes: each seek decodes at most one GOP, far less than every frame of the interval.
+            for keyframe_index in range(math.ceil(frame_count / keyframe_interval_frames)):
+                cap.set(cv2.CAP_PROP_POS_MSEC, keyframe_index * keyframe_interval_frames / fps * 1000)
+                ret, frame = cap.read()
+                if not ret:
+                    return
+                yield frame
+        else:
+            # Dense keyframes: frames are read sequentially. grab() still decodes every frame, but only the
+            # keyframes are converted with retrieve(), and the decoder never re-decodes from an I-frame.
+            current_frame_num = 0
+            while cap.grab():
+                if current_frame_num % keyframe_interval_frames == 0:
+                    ret, frame = cap.retrieve()
+                    if not ret:
+                        return
+                    yield frame
+                current_frame_num += 1
+
+    batch = []
+    batch_count = 0
+    last_hash = None
+    try:
+        for frame in read_keyframes():
+            if errors:
+                break
+            # Static shots produce runs of near-identical keyframes; only the first of each run is described.
+            frame_hash = frame_dhash(frame)
+            if last_hash is None or bin(frame_hash ^ last_hash).count("1") > DHASH_MAX_DISTANCE:
+                batch.append(base64.b64encode(encode_frame_jpeg(frame)).decode("utf-8"))
+                last_hash = frame_hash
+                if len(batch) == KEYFRAME_BATCH_SIZE:
+                    batch_queue.put((batch_count, batch))
+                    batch_count += 1
+                    batch = []
+        if batch and not errors:
+            batch_queue.put((batch_count, batch))
+    finally:
+        cap.release()
+        for _ in workers:
+            batch_queue.put(None)
+        for worker in workers:
+            worker.join()
+
+    if errors:
+        raise errors[0]
+    scene_descriptions = [desc for batch_index in sorted(batch_results) for desc in batch_results[batch_index]]
 
     if not scene_descriptions:
         return {"error": "Could not extract any keyframes or scene descriptions from the video."}
@@ -146,6 +394,16 @@ def analyze_video_hierarchically(file_path, user_prompt, keyframe_interval_secon
 
 
 # --- Main Execution Logic ---
+def write_json(result):
+    """Writes a result to stdout as indented JSON, serialized by orjson when available."""
+    if orjson is not None:
+        sys.stdout.buffer.write(orjson.dumps(result, option=orjson.OPT_INDENT_2) + b"\n")
+    else:
+        sys.stdout.write(json.dumps(result, indent=2) + "\n")
+    sys.stdout.flush()
+
+VIDEO_EXTENSIONS = frozenset({".mp4", ".avi", ".mov", ".mkv", ".flv", ".webm", ".m4v"})
+
 def main(input_data, tool_path):
     """
     Main function to process input from the n8n node.
@@ -173,8 +431,7 @@ def main(input_data, tool_path):
                  processed_results.append({"error": f"File not found: {file_path}"})
                  continue
 
-            video_extensions = {".mp4", ".avi", ".mov", ".mkv", ".flv"}
-            is_video = any(file_path.lower().endswith(ext) for ext in video_extensions)
+            is_video = os.path.splitext(file_path)[1].lower() in VIDEO_EXTENSIONS
 
             if is_video:
                 result = analyze_video_hierarchically(file_path, prompt, keyframe_interval)
@@ -186,7 +443,7 @@ def main(input_data, tool_path):
         except Exception as e:
             processed_results.append({"error": f"An unexpected error occurred processing {file_path}: {str(e)}"})
 
-    print(json.dumps(processed_results, indent=4))
+    write_json(processed_results)
 
 # --- Boilerplate for Direct Execution ---
 if __name__ == "__main__":
@@ -195,7 +452,7 @@ if __name__ == "__main__":
     stdin_content = sys.stdin.read()
     if stdin_content:
         try:
-            parsed_data = json.loads(stdin_content)
+            parsed_data = json_loads(stdin_content)
             subcommand_tool_path = os.environ.get("SUBCOMMAND_TOOL_PATH", "")
             main(parsed_data, subcommand_tool_path)
         except json.JSONDecodeError:
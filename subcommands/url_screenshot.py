@@ -1,8 +1,15 @@
 import sys
 import os
 import json
-import time
 import subprocess
+import importlib.metadata
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+json_loads = orjson.loads if orjson is not None else json.loads
 
 # --- Required Metadata ---
 # This section defines the contract with the Media Manager framework.
@@ -10,7 +17,8 @@ import subprocess
 # 1. DEPENDENCIES
 # The manager will install these packages.
 REQUIRES = [
-    "playwright"
+    "playwright",
+    "orjson",
 ]
 
 # 2. N8N UI SCHEMA
@@ -35,14 +43,34 @@ INPUT_SCHEMA = [
 ]
 
 # --- Helper Functions ---
-def _ensure_playwright_browsers_installed():
+def write_json(result):
+    """Writes a result to stdout as indented JSON, serialized by orjson when available."""
+    if orjson is not None:
+        sys.stdout.buffer.write(orjson.dumps(result, option=orjson.OPT_INDENT_2) + b"\n")
+    else:
+        sys.stdout.write(json.dumps(result, indent=2) + "\n")
+    sys.stdout.flush()
+
+def _ensure_playwright_browsers_installed(tool_path):
     """
     Runs `playwright install` to ensure browser binaries are present.
-    This is designed to be run once automatically.
+    A sentinel file in the tool folder records the Playwright version that installed them, so the
+    install only runs on the first call and again after Playwright itself is upgraded.
     """
+    sentinel_path = os.path.join(tool_path, ".playwright_installed")
+    playwright_version = importlib.metadata.version("playwright")
+    try:
+        with open(sentinel_path, "r", encoding="utf-8") as f:
+            if f.read().strip() == playwright_version:
+                return True
+    except OSError:
+        pass
+
     try:
         # Use sys.executable to ensure we're using the python from the correct virtual env
         subprocess.run([sys.executable, "-m", "playwright", "install"], check=True, capture_output=True, text=True)
+        with open(sentinel_path, "w", encoding="utf-8") as f:
+            f.write(playwright_version)
         return True
     except subprocess.CalledProcessError as e:
         # This error is often noisy but doesn't mean failure if browsers are already there.
@@ -54,13 +82,22 @@ def _ensure_playwright_browsers_installed():
         print(f"Failed to run Playwright install: {str(e)}", file=sys.stderr)
         return False
 
+# Output directories already created by this process; batches usually share one.
+_CREATED_DIRS = set()
+
+def _ensure_output_dir(output_dir):
+    """Creates 'output_dir' (and its parents) at most once per process."""
+    if output_dir and output_dir not in _CREATED_DIRS:
+        os.makedirs(output_dir, exist_ok=True)
+        _CREATED_DIRS.add(output_dir)
+
 # --- Main Execution Logic ---
 def main(input_data, tool_path):
     """
     Main function to take a screenshot of a given URL.
     """
     # It's good practice to import heavyweight libraries inside the main function.
-    from playwright.sync_api import sync_playwright
+    from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
 
     processed_results = []
 
@@ -72,44 +109,62 @@ def main(input_data, tool_path):
         raise ValueError("Invalid input format. Input JSON must contain either an '@item' or '@items' key.")
 
     # Run the one-time browser installation check.
-    if not _ensure_playwright_browsers_installed():
+    if not _ensure_playwright_browsers_installed(tool_path):
         raise RuntimeError("Failed to install or verify Playwright browsers. Cannot proceed.")
 
-    for item in script_items:
-        url = item.get("url")
-        output_path = item.get("output_path")
-
-        if not url or not output_path:
-            raise ValueError("Missing required parameters: 'url' and 'output_path' are required.")
-
-        output_dir = os.path.dirname(output_path)
-        if output_dir and not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            page = browser.new_page()
-            
-            # Navigate to the page and wait for it to be mostly loaded.
-            page.goto(url, wait_until="domcontentloaded", timeout=60000)
-            
-            # A simple loop to scroll to the bottom a few times.
-            # This helps trigger lazy-loaded images on many static sites.
-            for _ in range(3):
-                page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                time.sleep(2) # Wait for content to potentially load
-
-            # Take the final screenshot.
-            page.screenshot(path=output_path, full_page=True)
+    # One browser serves every item; launching Chromium is the most expensive step of a screenshot.
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=True)
+        try:
+            for item in script_items:
+                url = item.get("url")
+                output_path = item.get("output_path")
+
+                if not url or not output_path:
+                    raise ValueError("Missing required parameters: 'url' and 'output_path' are required.")
+
+                _ensure_output_dir(os.path.dirname(output_path))
+
+                # new_page() gives each item its own lightweight context, so cookies and storage don't leak between URLs.
+                page = browser.new_page()
+                try:
+                    # Navigate to the page and wait for it to be mostly loaded.
+                    page.goto(url, wait_until="domcontentloaded", timeout=60000)
+                    try:
+                        page.wait_for_load_state("networkidle", timeout=5000)
+                    except PlaywrightTimeoutError:
+                        pass # Pages that poll or stream never go idle; capture what has loaded.
+                    
+                    # Scroll to the bottom until the page stops growing (at most 3 times).
+                    # This helps trigger lazy-loaded images on many static sites.
+                    for _ in range(3):
+                        previous_height = page.evaluate("document.body.scrollHeight")
+                        page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+                        try:
+                            page.wait_for_function("h => document.body.scrollHeight > h", arg=previous_height, timeout=2000)
+                        except PlaywrightTimeoutError:
+                            break
+
+                    # Let images revealed by scrolling finish loading, without a fixed delay.
+                    try:
+                        page.wait_for_function("() => Array.from(document.images).every(img => img.complete)", timeout=5000)
+                    except PlaywrightTimeoutError:
+                        pass
+
+                    # Take the final screenshot.
+                    page.screenshot(path=output_path, full_page=True)
+                finally:
+                    page.context.close()
+
+                processed_results.append({
+                    "status": "success",
+                    "url": url,
+                    "output_file": os.path.abspath(output_path)
+                })
+        finally:
             browser.close()
 
-        processed_results.append({
-            "status": "success",
-            "url": url,
-            "output_file": os.path.abspath(output_path)
-        })
-
-    print(json.dumps({"results": processed_results}, indent=4))
+    write_json({"results": processed_results})
 
 
 # --- Boilerplate for Direct Execution ---
@@ -117,7 +172,7 @@ if __name__ == "__main__":
     stdin_content = sys.stdin.read()
     if stdin_content:
         try:
-            parsed_data = json.loads(stdin_content)
+            parsed_data = json_loads(stdin_content)
             subcommand_tool_path = os.environ.get("SUBCOMMAND_TOOL_PATH")
             if not subcommand_tool_path:
                 raise EnvironmentError("SUBCOMMAND_TOOL_PATH environment variable not set by manager.")